@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os.path
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from detections import DetectionColumns, DetectionWriter
+from marker_detector import ARUCO_DICT, DEFAULT_ARUCO_DICT_NAME, DEFAULT_DETECTOR_PRESET_NAME, DEFAULT_MARKER_LENGTH_MM, DETECTOR_PRESETS_PATH, MarkerDetector
+from utils import load_coefficients_or_default
+
+OUTPUT_FORMATS = ('csv', 'npz')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+@dataclass
+class Chunk:
+    # 一段影片（影格範圍）或一組圖片，為單一工作單位
+    source: str
+    start: int
+    stop: int  # 不含
+    output_path: str
+    files: List[str] = field(default_factory=list)  # 圖片資料夾的檔案，依影格順序
+    until_end: bool = False  # 影片的最後一段：影格總數可能不精確，讀到結尾為止
+
+    @property
+    def frame_count(self) -> int:
+        return self.stop - self.start
+
+
+def source_key(source: str) -> str:
+    """ Base name of `source` plus a short hash of its absolute path, unique per input. """
+    path = os.path.abspath(source)
+    return f'{os.path.basename(path)}-{hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]}'
+
+
+def chunk_manifest(source: str, detector: MarkerDetector) -> Dict[str, Any]:
+    """ Input and detector settings the chunk outputs depend on; existing chunks are only reused when these are unchanged. """
+    settings = detector.settings()
+    # 工作執行緒數不影響結果；其他預設組合亦無關
+    settings.pop('tile_workers')
+    settings['preset'] = settings.pop('presets')[detector.preset_name]
+    manifest = {'source': os.path.abspath(source), 'detector': settings}
+    # 經 JSON 來回轉換（numpy 陣列轉為 list），以便與讀回的檔案比較
+    return json.loads(json.dumps(manifest, default=lambda value: value.tolist()))
+
+
+def check_manifest(chunk_dir: str, manifest: Dict[str, Any]) -> None:
+    """ Discards the chunks of `chunk_dir` written with other settings, then records `manifest`. """
+    manifest_path = os.path.join(chunk_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous != manifest:
+            print(f'Settings changed since {chunk_dir} was written, discarding its chunks.')
+            for path in glob.glob(os.path.join(chunk_dir, 'frames_*')):
+                os.remove(path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def list_images(folder: str) -> List[str]:
+    return sorted(path for path in glob.glob(os.path.join(folder, '*')) if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def plan_chunks(source: str, chunk_dir: str, output_format: str, chunk_frames: int, shard_images: int) -> List[Chunk]:
+    """ Splits a video into frame ranges, or an image folder into shards of files. """
+    chunks = []
+    if os.path.isdir(source):
+        files = list_images(source)
+        for start in range(0, len(files), shard_images):
+            stop = min(start + shard_images, len(files))
+            chunks.append(Chunk(source, start, stop, os.path.join(chunk_dir, f'frames_{start:08d}-{stop:08d}.{output_format}'), files[start:stop]))
+        # 影格編號對應的檔名
+        with open(os.path.join(chunk_dir, 'files.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(files) + '\n')
+        return chunks
+
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        raise ValueError(f'Cannot open video {source}')
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    for start in range(0, max(frame_count, 1), chunk_frames):
+        stop = min(start + chunk_frames, frame_count)
+        until_end = stop >= frame_count
+        name = f'frames_{start:08d}-end' if until_end else f'frames_{start:08d}-{stop:08d}'
+        chunks.append(Chunk(source, start, stop, os.path.join(chunk_dir, f'{name}.{output_format}'), until_end=until_end))
+    return chunks
+
+
+# 以下於子行程中執行
+
+_worker_detector: MarkerDetector = None
+
+
+def _init_worker(detector_settings: Dict[str, Any]) -> None:
+    global _worker_detector
+    _worker_detector = MarkerDetector.from_settings(detector_settings)
+
+
+def _iterate_video(chunk: Chunk):
+    video = cv2.VideoCapture(chunk.source)
+    fps = video.get(cv2.CAP_PROP_FPS) or 0
+    video.set(cv2.CAP_PROP_POS_FRAMES, chunk.start)
+    if int(video.get(cv2.CAP_PROP_POS_FRAMES)) != chunk.start:
+        # 無法精確跳轉時，從頭逐格略過
+        video.release()
+        video = cv2.VideoCapture(chunk.source)
+        for _ in range(chunk.start):
+            video.grab()
+    frame_index = chunk.start
+    try:
+        while chunk.until_end or frame_index < chunk.stop:
+            ret, frame = video.read()
+            if not ret:
+                break
+            yield frame_index, frame_index / fps if fps else 0.0, frame
+            frame_index += 1
+    finally:
+        video.release()
+
+
+def _iterate_images(chunk: Chunk):
+    for frame_index, path in enumerate(chunk.files, chunk.start):
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f'Cannot read {path}, skipped.')
+            continue
+        yield frame_index, os.path.getmtime(path), frame
+
+
+def _process_chunk(chunk: Chunk, output_format: str) -> int:
+    """ Detects markers in every frame of the chunk; the output file only appears once the chunk is complete. """
+    frames = _iterate_images(chunk) if chunk.files else _iterate_video(chunk)
+    partial_path = chunk.output_path + '.partial'
+    processed_count = 0
+    if output_format == 'csv':
+        with open(partial_path, 'w', newline='') as f:
+            writer = DetectionWriter(f, 'csv')
+            for frame_index, timestamp, frame in frames:
+                writer.write(frame_index, timestamp, _worker_detector.process(frame).detections)
+                processed_count += 1
+    else:
+        columns = DetectionColumns()
+        for frame_index, timestamp, frame in frames:
+            columns.write(frame_index, timestamp, _worker_detector.process(frame).detections)
+            processed_count += 1
+        with open(partial_path, 'wb') as f:
+            columns.save(f)
+    os.replace(partial_path, chunk.output_path)
+    return processed_count
+
+
+def merge_chunks(chunks: List[Chunk], output_path: str, output_format: str) -> None:
+    """ Concatenates the chunk outputs (in frame order) into one file. """
+    if output_format == 'csv':
+        with open(output_path, 'w', newline='') as output:
+            for i, chunk in enumerate(chunks):
+                with open(chunk.output_path, newline='') as f:
+                    header = f.readline()
+                    if i == 0:
+                        output.write(header)
+                    for line in f:
+                        output.write(line)
+    else:
+        parts = [np.load(chunk.output_path) for chunk in chunks]
+        with open(output_path, 'wb') as output:
+            np.savez(output, **{key: np.concatenate([part[key] for part in parts]) for key in parts[0].files})
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect ArUco markers in video files and image folders with a process pool.')
+    parser.add_argument('inputs', nargs='+', help='Video files and/or image folders.')
+    parser.add_argument('--output-dir', default='batch_output', help='Output directory (one file per input, plus per-chunk files used to resume).')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='Columnar output format.')
+    parser.add_argument('--chunk-frames', type=int, default=500, help='Frames per video chunk.')
+    parser.add_argument('--shard-images', type=int, default=200, help='Images per image folder shard.')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count).')
+    parser.add_argument('--dict', choices=list(ARUCO_DICT.keys()), default=DEFAULT_ARUCO_DICT_NAME, help='ArUco dictionary.')
+    parser.add_argument('--preset', default=DEFAULT_DETECTOR_PRESET_NAME, help=f'Detector parameters preset defined in {DETECTOR_PRESETS_PATH}.')
+    parser.add_argument('--marker-length', type=float, default=DEFAULT_MARKER_LENGTH_MM, help='Marker length (mm).')
+    parser.add_argument('--calibration', default='camera.yml', help='Camera coefficients file.')
+    parser.add_argument('--no-undistortion', action='store_true', help='Disable undistortion.')
+    args = parser.parse_args()
+
+    camera_matrix, distortion_coefficients = load_coefficients_or_default(args.calibration)
+    detector = MarkerDetector(aruco_dict_name=args.dict, marker_length_mm=args.marker_length, camera_matrix=camera_matrix,
+                              distortion_coefficients=distortion_coefficients, undistortion=not args.no_undistortion, preset_name=args.preset)
+
+    # 規劃所有工作；已完成的區段（輸出檔已存在）直接略過，可於中斷後接續
+    outputs = []
+    pending: List[Chunk] = []
+    total_frames = 0
+    done_frames = 0
+    # 同一輸入只處理一次；區段資料夾以完整路徑區分，不同資料夾中同名的輸入不會共用
+    sources = list(dict.fromkeys(os.path.abspath(source) for source in args.inputs))
+    names = [os.path.basename(source) for source in sources]
+    for source, name in zip(sources, names):
+        key = source_key(source)
+        chunk_dir = os.path.join(args.output_dir, f'{key}.chunks')
+        os.makedirs(chunk_dir, exist_ok=True)
+        check_manifest(chunk_dir, chunk_manifest(source, detector))
+        chunks = plan_chunks(source, chunk_dir, args.format, args.chunk_frames, args.shard_images)
+        # 同名的輸入以路徑雜湊區分輸出檔名
+        output_name = name if names.count(name) == 1 else key
+        outputs.append((chunks, os.path.join(args.output_dir, f'{output_name}.{args.format}')))
+        for chunk in chunks:
+            total_frames += chunk.frame_count
+            if os.path.exists(chunk.output_path):
+                done_frames += chunk.frame_count
+            else:
+                pending.append(chunk)
+    chunk_count = sum(len(chunks) for chunks, _ in outputs)
+    print(f'{chunk_count} chunks, {chunk_count - len(pending)} already done, ~{total_frames} frames')
+
+    if pending:
+        start_time = time.time()
+        processed_frames = 0
+        done_chunks = chunk_count - len(pending)
+        # 使用 spawn，每個行程各自建立一次偵測器
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(detector.settings(),)) as executor:
+            futures = {executor.submit(_process_chunk, chunk, args.format): chunk for chunk in pending}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    processed_frames += future.result()
+                except Exception as e:
+                    print(f'{chunk.output_path} failed: {e}')
+                    continue
+                done_chunks += 1
+                elapsed = time.time() - start_time
+                fps = processed_frames / elapsed if elapsed else 0
+                remaining = max(total_frames - done_frames - processed_frames, 0)
+                eta = format_duration(remaining / fps) if fps else '?'
+                print(f'[{done_chunks}/{chunk_count} chunks] {done_frames + processed_frames}/{total_frames} frames, {fps:.1f} fps, ETA {eta}', flush=True)
+
+    for chunks, output_path in outputs:
+        if all(os.path.exists(chunk.output_path) for chunk in chunks) and chunks:
+            merge_chunks(chunks, output_path, args.format)
+            print(f'Detections saved to {output_path}')
+        else:
+            print(f'{output_path} is incomplete, run again to resume.')
+
+
+if __name__ == '__main__':
+    main()
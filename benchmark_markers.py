@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import math
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from marker_detector import ARUCO_DICT, DEFAULT_DETECTOR_PRESET_NAME, DetectorRegistry, MarkerDetector
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+RESULT_FIELDS = ['commit', 'dict', 'resolution', 'markers', 'frames', 'fps', 'frame_ms', 'marker_us',
+                 'recall', 'false_positives', 'corner_error_px', 'translation_error_mm', 'rotation_error_deg']
+
+
+@dataclass
+class SyntheticScene:
+    image: np.ndarray
+    ids: np.ndarray  # (N,)
+    corners: np.ndarray  # (N, 4, 2)，左上、右上、右下、左下
+    rvecs: np.ndarray  # (N, 3)
+    tvecs: np.ndarray  # (N, 3)，單位與 marker_length_mm 相同
+
+
+def synthetic_camera_matrix(width: int, height: int) -> np.ndarray:
+    return np.array([[width * 0.8, 0., width / 2.],
+                     [0., width * 0.8, height / 2.],
+                     [0., 0., 1.]])
+
+
+def dictionary_size(dictionary) -> int:
+    return dictionary.bytesList.shape[0]
+
+
+def render_scene(dictionary, marker_count: int, size, camera_matrix: np.ndarray, marker_length_mm: float,
+                 rng: np.random.Generator, max_tilt_degree: float = 30, noise_sigma: float = 4, blur_ksize: int = 3) -> SyntheticScene:
+    """
+    Renders `marker_count` distinct markers at random poses (one per grid cell, so they never overlap)
+    on a gray background, then adds Gaussian blur and noise. Returns the image with its ground truth.
+    """
+    width, height = size
+    focal_length = camera_matrix[0][0]
+    image = np.full((height, width), 128, np.uint8)
+
+    # 將畫面切成格子，每格放一個標記
+    cols = max(int(math.ceil(math.sqrt(marker_count * width / height))), 1)
+    rows = int(math.ceil(marker_count / cols))
+    cell_w, cell_h = width / cols, height / rows
+    cells = rng.permutation(rows * cols)[:marker_count]
+    ids = rng.choice(dictionary_size(dictionary), marker_count, replace=False)
+
+    half = marker_length_mm / 2
+    # 與 estimatePoseSingleMarkers 相同的標記座標系
+    object_points = np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], np.float64)
+    # 含白色邊框（quiet zone）的標記影像
+    marker_px = 64
+    border_px = marker_px // 4
+    all_corners, rvecs, tvecs = [], [], []
+    for marker_id, cell in zip(ids, cells):
+        row, col = divmod(int(cell), cols)
+        # 標記投影大小約為格子的 35%~55%，傾斜後仍留在格子內
+        side_px = min(cell_w, cell_h) * rng.uniform(0.35, 0.55)
+        z = focal_length * marker_length_mm / side_px
+        u = (col + 0.5) * cell_w
+        v = (row + 0.5) * cell_h
+        tvec = np.array([(u - camera_matrix[0][2]) * z / focal_length, (v - camera_matrix[1][2]) * z / focal_length, z])
+        # 先翻轉使標記面向相機，再加上隨機傾斜與旋轉
+        tilt_x, tilt_y = np.radians(rng.uniform(-max_tilt_degree, max_tilt_degree, 2))
+        spin = rng.uniform(0, 2 * np.pi)
+        rotation = cv2.Rodrigues(np.array([tilt_x, tilt_y, 0.]))[0] @ cv2.Rodrigues(np.array([np.pi, 0., 0.]))[0] @ cv2.Rodrigues(np.array([0., 0., spin]))[0]
+        rvec = cv2.Rodrigues(rotation)[0].flatten()
+        corners, _ = cv2.projectPoints(object_points, rvec, tvec, camera_matrix, None)
+        corners = corners.reshape(4, 2)
+
+        marker = aruco.drawMarker(dictionary, int(marker_id), marker_px)
+        marker = cv2.copyMakeBorder(marker, border_px, border_px, border_px, border_px, cv2.BORDER_CONSTANT, value=255)
+        # 只在標記的外接矩形內做透視變換
+        # 以像素中心為座標，黑色區域的外緣位於 border_px - 0.5
+        edge0, edge1 = border_px - 0.5, border_px + marker_px - 0.5
+        source = np.array([[edge0, edge0], [edge1, edge0], [edge1, edge1], [edge0, edge1]], np.float32)
+        homography = cv2.getPerspectiveTransform(source, corners.astype(np.float32))
+        outline = cv2.perspectiveTransform(np.array([[[-0.5, -0.5], [marker.shape[1], -0.5], [marker.shape[1], marker.shape[0]], [-0.5, marker.shape[0]]]], np.float32), homography)[0]
+        x0, y0 = np.maximum(np.floor(outline.min(axis=0)).astype(int), 0)
+        x1, y1 = np.minimum(np.ceil(outline.max(axis=0)).astype(int), [width, height])
+        if x1 <= x0 or y1 <= y0:
+            continue
+        local = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], np.float64) @ homography
+        warped = cv2.warpPerspective(marker, local, (int(x1 - x0), int(y1 - y0)), flags=cv2.INTER_LINEAR)
+        mask = cv2.warpPerspective(np.full_like(marker, 255), local, (int(x1 - x0), int(y1 - y0)), flags=cv2.INTER_NEAREST)
+        region = image[y0:y1, x0:x1]
+        region[mask > 0] = warped[mask > 0]
+
+        all_corners.append(corners)
+        rvecs.append(rvec)
+        tvecs.append(tvec)
+
+    if blur_ksize > 1:
+        image = cv2.GaussianBlur(image, (blur_ksize, blur_ksize), 0)
+    if noise_sigma > 0:
+        noise = rng.normal(0, noise_sigma, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    return SyntheticScene(image=cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), ids=ids[:len(all_corners)],
+                          corners=np.array(all_corners, np.float32).reshape(-1, 4, 2),
+                          rvecs=np.array(rvecs).reshape(-1, 3), tvecs=np.array(tvecs).reshape(-1, 3))
+
+
+def rotation_error_degree(rvec_a: np.ndarray, rvec_b: np.ndarray) -> float:
+    relative = cv2.Rodrigues(rvec_a)[0].T @ cv2.Rodrigues(rvec_b)[0]
+    return float(np.degrees(np.arccos(np.clip((np.trace(relative) - 1) / 2, -1, 1))))
+
+
+def evaluate(scene: SyntheticScene, detections: np.ndarray) -> Dict[str, float]:
+    """ Matches detections to the ground truth by ID. """
+    truth = {int(marker_id): i for i, marker_id in enumerate(scene.ids)}
+    corner_errors, translation_errors, rotation_errors = [], [], []
+    false_positives = 0
+    for detection in detections:
+        i = truth.get(int(detection['id']))
+        if i is None:
+            false_positives += 1
+            continue
+        corner_errors.append(np.linalg.norm(detection['corners'] - scene.corners[i], axis=1).mean())
+        translation_errors.append(np.linalg.norm(detection['tvec'] - scene.tvecs[i]))
+        rotation_errors.append(rotation_error_degree(detection['rvec'], scene.rvecs[i]))
+    return {
+        'matched': len(corner_errors),
+        'false_positives': false_positives,
+        'corner_errors': corner_errors,
+        'translation_errors': translation_errors,
+        'rotation_errors': rotation_errors,
+    }
+
+
+def run_case(registry: DetectorRegistry, dict_name: str, resolution: str, marker_count: int, frame_count: int,
+             preset_name: str, marker_length_mm: float, seed: int, detection_scale: float = 1.0,
+             tile_workers: int = None, tile_min_distance_mm: float = 50) -> Dict[str, object]:
+    width, height = RESOLUTIONS[resolution]
+    camera_matrix = synthetic_camera_matrix(width, height)
+    detector = MarkerDetector(aruco_dict_name=dict_name, marker_length_mm=marker_length_mm, camera_matrix=camera_matrix,
+                              distortion_coefficients=np.zeros(5), undistortion=False, preset_name=preset_name, registry=registry,
+                              detection_scale=detection_scale, tiled_detection=tile_workers is not None, tile_workers=tile_workers,
+                              tile_min_distance_mm=tile_min_distance_mm)
+    dictionary = registry.dictionary(dict_name)
+    marker_count = min(marker_count, dictionary_size(dictionary))
+    rng = np.random.default_rng(seed)
+    scenes = [render_scene(dictionary, marker_count, (width, height), camera_matrix, marker_length_mm, rng) for _ in range(frame_count)]
+
+    detector.process(scenes[0].image)  # warm up
+    elapsed = 0.0
+    truth_count = 0
+    stats = {'matched': 0, 'false_positives': 0, 'corner_errors': [], 'translation_errors': [], 'rotation_errors': []}
+    for scene in scenes:
+        start = time.perf_counter()
+        result = detector.process(scene.image)
+        elapsed += time.perf_counter() - start
+        truth_count += len(scene.ids)
+        for key, value in evaluate(scene, result.detections).items():
+            stats[key] += value
+    detector.close()
+
+    frame_time = elapsed / frame_count
+    return {
+        'dict': dict_name,
+        'resolution': resolution,
+        'markers': marker_count,
+        'frames': frame_count,
+        'fps': 1 / frame_time,
+        'frame_ms': frame_time * 1000,
+        'marker_us': frame_time * 1e6 / max(marker_count, 1),
+        'recall': stats['matched'] / max(truth_count, 1),
+        'false_positives': stats['false_positives'],
+        'corner_error_px': float(np.mean(stats['corner_errors'])) if stats['corner_errors'] else float('nan'),
+        'translation_error_mm': float(np.mean(stats['translation_errors'])) if stats['translation_errors'] else float('nan'),
+        'rotation_error_deg': float(np.mean(stats['rotation_errors'])) if stats['rotation_errors'] else float('nan'),
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def load_results(path: str) -> Dict[tuple, Dict[str, str]]:
+    with open(path, newline='') as f:
+        return {(row['dict'], row['resolution'], row['markers']): row for row in csv.DictReader(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark marker detection and pose estimation on synthetic scenes with known ground truth.')
+    parser.add_argument('--dicts', nargs='+', default=list(ARUCO_DICT.keys()), choices=list(ARUCO_DICT.keys()), metavar='DICT', help='Dictionaries to test (default: all).')
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS.keys()), choices=list(RESOLUTIONS.keys()))
+    parser.add_argument('--markers', nargs='+', type=int, default=[1, 10, 50, 200], help='Marker counts (limited by the dictionary size).')
+    parser.add_argument('--frames', type=int, default=5, help='Frames (random scenes) per case.')
+    parser.add_argument('--preset', default=DEFAULT_DETECTOR_PRESET_NAME, help='Detector parameters preset.')
+    parser.add_argument('--marker-length', type=float, default=21, help='Marker length (mm).')
+    parser.add_argument('--detection-scale', type=float, default=1.0, help='Coarse-to-fine detection scale (1 = full resolution only).')
+    parser.add_argument('--tile-workers', type=int, help='Enable tiled detection with this many threads.')
+    parser.add_argument('--tile-min-distance', type=float, default=50, help='Closest marker distance (mm) used to size the tile overlap.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this CSV file.')
+    parser.add_argument('--compare', help='CSV file of a previous run to compare fps and recall with.')
+    args = parser.parse_args()
+
+    registry = DetectorRegistry()
+    previous = load_results(args.compare) if args.compare else {}
+    commit = current_commit()
+    results: List[Dict[str, object]] = []
+
+    print(f'{"dict":<20} {"res":>5} {"markers":>7} {"fps":>8} {"ms/frame":>9} {"us/marker":>9} {"recall":>7} {"FP":>4} {"corner px":>9} {"t mm":>7} {"r deg":>7}')
+    for dict_name in args.dicts:
+        for resolution in args.resolutions:
+            # 標記數量不超過字典大小，重複的組合只測一次
+            dictionary_marker_counts = sorted({min(marker_count, dictionary_size(registry.dictionary(dict_name))) for marker_count in args.markers})
+            for marker_count in dictionary_marker_counts:
+                result = run_case(registry, dict_name, resolution, marker_count, args.frames, args.preset, args.marker_length, args.seed,
+                                  args.detection_scale, args.tile_workers, args.tile_min_distance)
+                result['commit'] = commit
+                results.append(result)
+                line = (f'{dict_name:<20} {resolution:>5} {result["markers"]:>7} {result["fps"]:>8.1f} {result["frame_ms"]:>9.2f} '
+                        f'{result["marker_us"]:>9.1f} {result["recall"]:>7.3f} {result["false_positives"]:>4} {result["corner_error_px"]:>9.3f} '
+                        f'{result["translation_error_mm"]:>7.2f} {result["rotation_error_deg"]:>7.2f}')
+                before = previous.get((dict_name, resolution, str(result['markers'])))
+                if before is not None:
+                    line += f'  fps {(result["fps"] / float(before["fps"]) - 1) * 100:+.1f}%, recall {result["recall"] - float(before["recall"]):+.3f}'
+                print(line)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import argparse
+import os.path
+import time
+
+import cv2
+import numpy as np
+
+from utils import Undistorter, load_coefficients
+
+
+def undistort_per_frame(frame: np.ndarray, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray) -> np.ndarray:
+    # 原本 detect.py 的作法：每張影像都重新計算新內參並完整執行 cv2.undistort
+    h, w = frame.shape[:2]
+    new_camera_mtx, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, distortion_coefficients, (w, h), 0, (w, h))
+    frame = cv2.undistort(frame, camera_matrix, distortion_coefficients, None, new_camera_mtx)
+    x, y, w, h = roi
+    return frame[y:y + h, x:x + w]
+
+
+def measure(func, frame: np.ndarray, iterations: int) -> float:
+    func(frame)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(frame)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-frame cv2.undistort against the cached remap Undistorter.')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--calibration', default='camera.yml', help='Coefficients file; synthetic coefficients are used if it does not exist.')
+    args = parser.parse_args()
+
+    camera_matrix, distortion_coefficients = None, None
+    if os.path.exists(args.calibration):
+        camera_matrix, distortion_coefficients = load_coefficients(args.calibration)
+    if camera_matrix is None or distortion_coefficients is None:
+        print('Using synthetic coefficients.')
+        camera_matrix = np.array([[args.width * 0.8, 0., args.width / 2.],
+                                  [0., args.width * 0.8, args.height / 2.],
+                                  [0., 0., 1.]])
+        distortion_coefficients = np.array([-0.25, 0.1, 0.001, 0.001, -0.02])
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    undistorter = Undistorter(camera_matrix, distortion_coefficients)
+
+    baseline = measure(lambda f: undistort_per_frame(f, camera_matrix, distortion_coefficients), frame, args.iterations)
+    cached = measure(undistorter.undistort, frame, args.iterations)
+
+    expected = undistort_per_frame(frame, camera_matrix, distortion_coefficients)
+    actual = undistorter.undistort(frame)
+    max_diff = int(np.abs(expected.astype(np.int16) - actual.astype(np.int16)).max()) if expected.shape == actual.shape else None
+
+    print(f'Frame size: {args.width} * {args.height}, {args.iterations} iterations')
+    print(f'cv2.undistort per frame: {baseline * 1000:.2f} ms/frame ({1 / baseline:.1f} fps)')
+    print(f'Undistorter (remap):     {cached * 1000:.2f} ms/frame ({1 / cached:.1f} fps)')
+    print(f'Speedup: {baseline / cached:.1f}x, max pixel difference: {max_diff}')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,16 +10,15 @@ import PySimpleGUI as sg
 import cv2
 import imutils
 import pandas as pd
-from PIL import Image, ImageTk, ImageOps
 
+from corner_cache import CornerCache, detect_chessboards, find_chessboard_corners
+from display import FrameDisplay
 from utils import CameraLooper, eat_next_event, save_coefficients, Chessboard
 
 calibration_images_path = './calibration_images'
 thumbnail_size = (400, 300)
 
-# 找棋盤格角點
-# 設置尋找亞像素角點的參數，採用的停止準則是最大循環次數30和最大誤差容限0.001
-criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)  # 阈值
+corner_cache_path = './calibration_corner_cache.json'
 
 # 預設棋盤格模板規格
 default_chessboard = Chessboard(w=9, h=6, square_size_mm=24.6)
@@ -48,60 +47,64 @@ def update_calibration_image_df(window, calibration_image_df: pd.DataFrame) -> p
     return calibration_image_df
 
 
-def detect_chessboard(window, chessboard: Chessboard, filename, image=None):
+def detect_chessboard(window, chessboard: Chessboard, corner_cache: CornerCache, filename, image=None):
+    file_path = os.path.join(calibration_images_path, filename)
     if image is None:
-        file_path = os.path.join(calibration_images_path, filename)
         image = cv2.imread(file_path)
     else:
         image = copy.deepcopy(image)
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    # 找到棋盤格角點
-    ret, corners = cv2.findChessboardCorners(gray, (chessboard.w, chessboard.h), None)
+    # 找到棋盤格角點（未修改過的影像直接使用快取結果）
+    result = corner_cache.get(file_path, chessboard.w, chessboard.h)
+    if result is None:
+        result = find_chessboard_corners(image, chessboard.w, chessboard.h)
+        corner_cache.put(file_path, chessboard.w, chessboard.h, result)
+        corner_cache.save()
+    ret, corners, image_size = result
     window.write_event_value('update_chessboard_detect_result', (filename, ret))
     if ret:
-        # 在原角點的基礎上尋找亞像素角點
-        cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
-        # 追加進入世界三維點和平面二維點中
-        # objpoints.append(objp)
-        # imgpoints.append(corners)
         # 將角點在圖像上顯示
         cv2.drawChessboardCorners(image, (chessboard.w, chessboard.h), corners, ret)
 
-    return ret, corners, image, gray,
+    return ret, corners, image
 
 
-def update_thumbnail_images(window, chessboard: Chessboard, filename: str):
+def update_thumbnail_images(window, chessboard: Chessboard, corner_cache: CornerCache, filename: str):
     file_path = os.path.join(calibration_images_path, filename)
     image = cv2.imread(file_path)
     thumbnail_image = imutils.resize(image, width=thumbnail_size[0], height=thumbnail_size[1])
     window.write_event_value('update_thumbnail_image', thumbnail_image)
 
-    ret, corners, image_with_marker, gray = detect_chessboard(window, chessboard, filename, image)
+    ret, corners, image_with_marker = detect_chessboard(window, chessboard, corner_cache, filename, image)
     thumbnail_image_with_marker = imutils.resize(image_with_marker, width=thumbnail_size[0], height=thumbnail_size[1])
     window.write_event_value('update_thumbnail_image_with_marker', thumbnail_image_with_marker)
 
 
-def calibrate(window, chessboard: Chessboard, calibration_image_df: pd.DataFrame):
-    row_count = len(calibration_image_df)
-
+def calibrate(window, chessboard: Chessboard, corner_cache: CornerCache, calibration_image_df: pd.DataFrame):
     # 儲存棋盤格角點的世界坐標和圖像坐標對
     obj_points = []  # 在世界坐標系中的三維點
     img_points = []  # 在圖像平面的二維點
+    image_size = None
+
+    # 以多個行程平行尋找角點，已快取的影像不重新偵測
+    file_paths = [os.path.join(calibration_images_path, filename) for filename in calibration_image_df['filename']]
+    results = detect_chessboards(file_paths, chessboard.w, chessboard.h, corner_cache,
+                                 progress_callback=lambda done, total: window.write_event_value('update_progress', (done, total)))
 
-    for idx, row in calibration_image_df.iterrows():
-        window.write_event_value('update_progress', (idx + 1, row_count))
-        ret, corners, image_with_marker, gray = detect_chessboard(window, chessboard, row['filename'])
+    for filename, file_path in zip(calibration_image_df['filename'], file_paths):
+        ret, corners, size = results[file_path]
+        window.write_event_value('update_chessboard_detect_result', (filename, ret))
         if ret:
             # 追加進入世界三維點和平面二維點中
             obj_points.append(chessboard.objp)
             img_points.append(corners)
+            image_size = size
 
     if len(img_points) == 0:
         window.write_event_value('calibrate_finished', 'No chessboard images found')
         return
 
-    ret, camera_matrix, distortion_coefficients, rvecs, tvecs = cv2.calibrateCamera(obj_points, img_points, gray.shape[::-1], None, None)
+    ret, camera_matrix, distortion_coefficients, rvecs, tvecs = cv2.calibrateCamera(obj_points, img_points, image_size, None, None)
     print('ret:', ret)
     print('camera_matrix:\n', camera_matrix)  # 內參數矩陣
     print('distortion_coefficients 畸變係數:\n', distortion_coefficients)  # 畸變係數   distortion coefficients = (k_1,k_2,p_1,p_2,k_3)
@@ -116,6 +119,7 @@ def calibrate(window, chessboard: Chessboard, calibration_image_df: pd.DataFrame
 def main():
     resize_size = 720
     chessboard = copy.deepcopy(default_chessboard)
+    corner_cache = CornerCache(corner_cache_path)
 
     calibration_image_df = pd.DataFrame({
         'filename': [],
@@ -167,6 +171,9 @@ def main():
     ]
 
     window = sg.Window('CalibrateCamera', layout, location=(100, 100))
+    frame_display = FrameDisplay(window['image'])
+    thumbnail_display = FrameDisplay(window['thumbnail'])
+    thumbnail_with_marker_display = FrameDisplay(window['thumbnail_with_marker'])
 
     camera_looper = CameraLooper()
 
@@ -175,6 +182,8 @@ def main():
 
     recent_frame_count = 10
     recent_frame_time = deque([0.0], maxlen=recent_frame_count)
+    last_frame_seq = 0
+    frame_wait_timeout = 0.01  # 等待新影像的時間上限，期間外仍可處理 GUI 事件
 
     try:
         while True:
@@ -189,7 +198,7 @@ def main():
                     selected_row_index = None
                 if selected_row_index is not None:
                     selected_filename = calibration_image_df.loc[selected_row_index, 'filename']
-                    thread = threading.Thread(target=update_thumbnail_images, args=(window, chessboard, selected_filename), daemon=True)
+                    thread = threading.Thread(target=update_thumbnail_images, args=(window, chessboard, corner_cache, selected_filename), daemon=True)
                     thread.start()
                     window['delete_selected_image'].update(disabled=False)
                 else:
@@ -211,11 +220,11 @@ def main():
 
             if event == 'update_thumbnail_image':
                 thumbnail_image = values['update_thumbnail_image']
-                window['thumbnail'].update(data=ImageTk.PhotoImage(image=Image.fromarray(thumbnail_image[:, :, ::-1])))
+                thumbnail_display.update(thumbnail_image)
 
             if event == 'update_thumbnail_image_with_marker':
                 thumbnail_image_with_marker = values['update_thumbnail_image_with_marker']
-                window['thumbnail_with_marker'].update(data=ImageTk.PhotoImage(image=Image.fromarray(thumbnail_image_with_marker[:, :, ::-1])))
+                thumbnail_with_marker_display.update(thumbnail_image_with_marker)
 
             if event == 'delete_selected_image':
                 selected_row_index = values["table"][0]
@@ -266,7 +275,7 @@ def main():
                 window['h_input'].update(chessboard.h, disabled=True)
                 window['square_size_input'].update(chessboard.square_size_mm, disabled=True)
                 window['calibrate'].update(disabled=True)
-                thread = threading.Thread(target=calibrate, args=(window, chessboard, calibration_image_df), daemon=True)
+                thread = threading.Thread(target=calibrate, args=(window, chessboard, corner_cache, calibration_image_df), daemon=True)
                 thread.start()
 
             if event == 'calibrate_finished':
@@ -287,31 +296,32 @@ def main():
             if event.startswith('Resize to '):
                 resize_size = int(event.split(' ')[-1])
 
-            ret, frame = camera_looper.read()
+            if event == 'capture':
+                ret, frame = camera_looper.read()
+                if ret:
+                    filename = time.strftime('%Y%m%d_%H%M%S', time.localtime()) + '.jpg'
+                    file_path = os.path.join(calibration_images_path, filename)
+                    if not os.path.exists(os.path.dirname(file_path)):
+                        os.makedirs(os.path.dirname(file_path))
+                    cv2.imwrite(file_path, frame)
+
+                    # Update file list
+                    calibration_image_df = update_calibration_image_df(window, calibration_image_df)
+                    selected_index = calibration_image_df.filename.eq(filename).idxmax()
+                    window['table'].update(select_rows=[selected_index])  # 似乎會自動觸發事件（似乎被認定為 Bug）
+                    window['table'].Widget.see(selected_index + 1)
+                    eat_next_event(window, 'table')  # 消除前述錯誤觸發的事件
+                    window.write_event_value('table', [selected_index])
+
+            # 僅在有新影像時才更新畫面，避免重複處理同一張影像
+            ret, frame, frame_seq = camera_looper.wait_for_frame(last_frame_seq, timeout=frame_wait_timeout)
+            if frame_seq == last_frame_seq:
+                continue
+            last_frame_seq = frame_seq
             if not ret:
                 continue
 
-            if event == 'capture':
-                filename = time.strftime('%Y%m%d_%H%M%S', time.localtime()) + '.jpg'
-                file_path = os.path.join(calibration_images_path, filename)
-                if not os.path.exists(os.path.dirname(file_path)):
-                    os.makedirs(os.path.dirname(file_path))
-                cv2.imwrite(file_path, frame)
-
-                # Update file list
-                calibration_image_df = update_calibration_image_df(window, calibration_image_df)
-                selected_index = calibration_image_df.filename.eq(filename).idxmax()
-                window['table'].update(select_rows=[selected_index])  # 似乎會自動觸發事件（似乎被認定為 Bug）
-                window['table'].Widget.see(selected_index + 1)
-                eat_next_event(window, 'table')  # 消除前述錯誤觸發的事件
-                window.write_event_value('table', [selected_index])
-
-            # img_bytes = cv2.imencode('.png', frame)[1].tobytes()
-            image = Image.fromarray(frame[:, :, ::-1])
-            if resize_size:
-                image = ImageOps.contain(image, (resize_size, resize_size))
-            img_bytes = ImageTk.PhotoImage(image=image)
-            window['image'].update(data=img_bytes)
+            frame_display.update(frame, resize_size)
             window['capture_fps'].update(f'Capture: {camera_looper.fps:.1f} fps')
 
             new_frame_time = time.time()
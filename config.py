@@ -1,2 +1,22 @@
 # Video source for cv2.VideoCapture. Index to camera or IP/path to video file.
 VIDEO_CAPTURE_SOURCE = 0
+
+# 擷取設定，連線時套用並回報實際協商結果；None 表示沿用驅動程式預設值
+CAPTURE_PROFILE = {
+    'width': 1280,
+    'height': 720,
+    'fps': 60,
+    # 'MJPG' 可避免 UVC 攝影機以 YUYV 傳輸而被限制在較低的 fps
+    'fourcc': 'MJPG',
+    # 驅動程式佇列的影像數，越少延遲越低（並非所有後端都支援）
+    'buffer_size': 1,
+    # cv2.CAP_* 名稱，例如 'CAP_V4L2'、'CAP_DSHOW'、'CAP_MSMF'、'CAP_FFMPEG'；None 由 OpenCV 自動選擇
+    'backend': None,
+    # cv2.CAP_PROP_AUTO_EXPOSURE 與 cv2.CAP_PROP_EXPOSURE 的值，意義依後端而異
+    'auto_exposure': None,
+    'exposure': None,
+    # 即時來源：以 grab() 丟棄已在佇列中等待的過時影像，只解碼最新的一張
+    'drain_stale_frames': True,
+    # 連線後量測影像間隔（抖動）所用的影像數，0 表示不量測
+    'jitter_sample_frames': 30,
+}
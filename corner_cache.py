@@ -0,0 +1,127 @@
+import json
+import multiprocessing
+import os.path
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 設置尋找亞像素角點的參數，採用的停止準則是最大循環次數30和最大誤差容限0.001
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)  # 阈值
+
+# (ret, corners, image_size)；image_size 為 (w, h)
+ChessboardResult = Tuple[bool, Optional[np.ndarray], Tuple[int, int]]
+
+
+def find_chessboard_corners(image: np.ndarray, w: int, h: int) -> ChessboardResult:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # 找到棋盤格角點
+    ret, corners = cv2.findChessboardCorners(gray, (w, h), None)
+    if ret:
+        # 在原角點的基礎上尋找亞像素角點
+        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+    return bool(ret), corners if ret else None, gray.shape[::-1]
+
+
+def find_chessboard_corners_in_file(file_path: str, w: int, h: int) -> ChessboardResult:
+    # 於子行程中執行，只回傳角點（不回傳影像）以減少行程間傳輸
+    image = cv2.imread(file_path)
+    if image is None:
+        return False, None, (0, 0)
+    return find_chessboard_corners(image, w, h)
+
+
+class CornerCache:
+    """
+    On-disk cache of chessboard corners, keyed by file path, file mtime and chessboard w/h,
+    so unchanged calibration images are never re-detected.
+    """
+
+    def __init__(self, path: str = 'calibration_corner_cache.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                print(f'Corner cache {path} is unreadable, starting empty.')
+
+    @staticmethod
+    def key(file_path: str, w: int, h: int) -> str:
+        return f'{os.path.abspath(file_path)}|{os.stat(file_path).st_mtime_ns}|{w}x{h}'
+
+    def get(self, file_path: str, w: int, h: int) -> Optional[ChessboardResult]:
+        try:
+            key = self.key(file_path, w, h)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        corners = np.array(entry['corners'], np.float32).reshape(-1, 1, 2) if entry['ret'] else None
+        return entry['ret'], corners, tuple(entry['image_size'])
+
+    def put(self, file_path: str, w: int, h: int, result: ChessboardResult) -> None:
+        ret, corners, image_size = result
+        try:
+            key = self.key(file_path, w, h)
+        except OSError:
+            return
+        with self._lock:
+            self._entries[key] = {
+                'ret': ret,
+                'corners': corners.reshape(-1, 2).tolist() if ret else None,
+                'image_size': list(image_size),
+            }
+
+    def save(self) -> None:
+        with self._lock:
+            # 清除已刪除或已修改檔案的項目
+            entries = {}
+            for key, entry in self._entries.items():
+                file_path, mtime_ns, _ = key.split('|')
+                if os.path.exists(file_path) and str(os.stat(file_path).st_mtime_ns) == mtime_ns:
+                    entries[key] = entry
+            self._entries = entries
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+
+
+def detect_chessboards(file_paths: List[str], w: int, h: int, cache: CornerCache, max_workers: int = None,
+                       progress_callback: Callable[[int, int], None] = None) -> Dict[str, ChessboardResult]:
+    """
+    Finds the chessboard corners of every file, reusing cached results
+    and fanning the remaining images out to a process pool.
+    """
+    results = {}
+    pending = []
+    for file_path in file_paths:
+        cached = cache.get(file_path, w, h)
+        if cached is None:
+            pending.append(file_path)
+        else:
+            results[file_path] = cached
+
+    done_count = len(results)
+    if progress_callback:
+        progress_callback(done_count, len(file_paths))
+
+    if pending:
+        # 使用 spawn 避免在 GUI 執行緒仍在運作時 fork
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(find_chessboard_corners_in_file, file_path, w, h): file_path for file_path in pending}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                results[file_path] = future.result()
+                cache.put(file_path, w, h, results[file_path])
+                done_count += 1
+                if progress_callback:
+                    progress_callback(done_count, len(file_paths))
+        cache.save()
+
+    return results
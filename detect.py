@@ -1,90 +1,50 @@
 #!/usr/bin/env python
-import math
+import argparse
+import contextlib
+import os
 import re
+import sys
 import time
 from collections import deque
 
-import PySimpleGUI as sg
-import cv2
-import cv2.aruco as aruco
 import numpy as np
-import pandas as pd
-from PIL import Image, ImageTk, ImageOps
-from scipy.spatial.transform import Rotation as R
 
-from utils import CameraLooper, embed_img, create_text_pad, load_coefficients
+from detections import DETECTION_DTYPE, DetectionWriter, TABLE_HEADINGS, detections_to_dataframe, table_rows
+from marker_detector import ARUCO_DICT, DEFAULT_ARUCO_DICT_NAME, DEFAULT_DETECTOR_PRESET_NAME, DEFAULT_MARKER_LENGTH_MM, DETECTOR_PRESETS_PATH, MarkerDetector, run_headless, save_detector_presets
+from load_shedding import LoadShedder
+from metrics import MetricsDumper, PerformanceMetrics, draw_metrics_overlay, timed
+from pipeline import Pipeline
+from recording import ReplayCamera
+from utils import CameraLooper, RenderScheduler, load_coefficients_or_default
 
-ARUCO_DICT = {
-    "DICT_4X4_50": aruco.DICT_4X4_50,
-    "DICT_4X4_100": aruco.DICT_4X4_100,
-    "DICT_4X4_250": aruco.DICT_4X4_250,
-    "DICT_4X4_1000": aruco.DICT_4X4_1000,
-    "DICT_5X5_50": aruco.DICT_5X5_50,
-    "DICT_5X5_100": aruco.DICT_5X5_100,
-    "DICT_5X5_250": aruco.DICT_5X5_250,
-    "DICT_5X5_1000": aruco.DICT_5X5_1000,
-    "DICT_6X6_50": aruco.DICT_6X6_50,
-    "DICT_6X6_100": aruco.DICT_6X6_100,
-    "DICT_6X6_250": aruco.DICT_6X6_250,
-    "DICT_6X6_1000": aruco.DICT_6X6_1000,
-    "DICT_7X7_50": aruco.DICT_7X7_50,
-    "DICT_7X7_100": aruco.DICT_7X7_100,
-    "DICT_7X7_250": aruco.DICT_7X7_250,
-    "DICT_7X7_1000": aruco.DICT_7X7_1000,
-    "DICT_ARUCO_ORIGINAL": aruco.DICT_ARUCO_ORIGINAL,
-    "DICT_APRILTAG_16h5": aruco.DICT_APRILTAG_16h5,
-    "DICT_APRILTAG_25h9": aruco.DICT_APRILTAG_25h9,
-    "DICT_APRILTAG_36h10": aruco.DICT_APRILTAG_36h10,
-    "DICT_APRILTAG_36h11": aruco.DICT_APRILTAG_36h11
-}
 
+def run_gui(detector: MarkerDetector, pipeline_delivery: str = None, camera=None, load_shedder: LoadShedder = None):
+    # GUI 相關套件僅在 GUI 模式下載入，讓無頭環境不需安裝 Tk
+    import PySimpleGUI as sg
+    from display import FrameDisplay
 
-def euler_from_quaternion(x, y, z, w):
-    """
-    Convert a quaternion into euler angles (roll, pitch, yaw)
-    roll is rotation around x in radians (counterclockwise)
-    pitch is rotation around y in radians (counterclockwise)
-    yaw is rotation around z in radians (counterclockwise)
-    """
-    t0 = +2.0 * (w * x + y * z)
-    t1 = +1.0 - 2.0 * (x * x + y * y)
-    roll_x = math.atan2(t0, t1)
-
-    t2 = +2.0 * (w * y - z * x)
-    t2 = +1.0 if t2 > +1.0 else t2
-    t2 = -1.0 if t2 < -1.0 else t2
-    pitch_y = math.asin(t2)
-
-    t3 = +2.0 * (w * z + x * y)
-    t4 = +1.0 - 2.0 * (y * y + z * z)
-    yaw_z = math.atan2(t3, t4)
-
-    return roll_x, pitch_y, yaw_z  # in radians
-
-
-def main():
-    default_aruco_dict_name = 'DICT_6X6_1000'
-    selected_aruco_dict = ARUCO_DICT[default_aruco_dict_name]
     draw_crosshair = True
     draw_custom_marker = False
     draw_axis = False
-    undistortion = True
+    show_metrics = False
     resize_size = 720
-
-    marker_length_mm = 103
-    marker_length_mm = 21
+    gui_refresh_rate = 30  # GUI 每秒更新次數上限
 
     sg.theme('DefaultNoMoreNagging')
 
-    empty_detected_marker_df = pd.DataFrame(columns=['id', '偏航(yaw)', '俯仰(pitch)', '滾動(roll)', '橫向偏移(cm)', '縱向偏移(cm)', '距離(cm)', '橫向角度', '縱向角度'])
+    # 首次使用 GUI 時寫出完整的預設組合，供使用者修改
+    if not os.path.exists(DETECTOR_PRESETS_PATH):
+        save_detector_presets(detector.registry.presets)
+
+    render_scheduler = RenderScheduler(refresh_rate=gui_refresh_rate)
 
     layout = [
         [sg.Text('ArUcoMarkerDetection', size=(40, 1), justification='center', font='Helvetica 20', expand_x=True)],
         [
-            sg.Image(filename='', key='image', right_click_menu=['', ['Original size', 'Resize to 360', 'Resize to 480', 'Resize to 720', 'Resize to 1080']]),
+            sg.Image(filename='', key='image', right_click_menu=['', ['Original size', 'Resize to 360', 'Resize to 480', 'Resize to 720', 'Resize to 1080', '---', 'GUI refresh 15 fps', 'GUI refresh 30 fps', 'GUI refresh 60 fps']]),
             sg.Table(
-                values=empty_detected_marker_df.values.tolist(),
-                headings=empty_detected_marker_df.columns.tolist(),
+                values=[],
+                headings=TABLE_HEADINGS,
                 auto_size_columns=False,
                 display_row_numbers=False,
                 justification='left',
@@ -99,42 +59,54 @@ def main():
         [
             sg.Text('ArUco Dictionary:'),
             sg.Combo(values=list(ARUCO_DICT.keys()), key='dict_select', readonly=True, size=(40, 1),
-                     default_value=default_aruco_dict_name, enable_events=True),
+                     default_value=detector.aruco_dict_name, enable_events=True),
+            sg.Text('Detector preset:'),
+            sg.Combo(values=list(detector.registry.presets.keys()), key='preset_select', readonly=True, size=(12, 1),
+                     default_value=detector.preset_name, enable_events=True),
+            sg.Text('Detection scale:'),
+            sg.Combo(values=[1.0, 0.75, 0.5, 0.25], key='detection_scale', readonly=True, size=(5, 1),
+                     default_value=detector.detection_scale, enable_events=True),
+            sg.Checkbox('Tiled detection', key='tiled_detection', enable_events=True, default=detector.tiled_detection),
             sg.Checkbox('Draw crosshair', key='draw_crosshair', enable_events=True, default=draw_crosshair),
             sg.Checkbox('Draw custom marker', key='draw_custom_marker', enable_events=True, default=draw_custom_marker),
             sg.Checkbox('Draw axis', key='draw_axis', enable_events=True, default=draw_axis),
-            sg.Checkbox('Undistortion', key='undistortion', enable_events=True, default=undistortion),
+            sg.Checkbox('Undistortion', key='undistortion', enable_events=True, default=detector.undistortion),
+            sg.Checkbox('ROI tracking', key='roi_tracking', enable_events=True, default=detector.roi_tracking),
+            sg.Checkbox('Flow tracking', key='flow_tracking', enable_events=True, default=detector.flow_tracking),
+            sg.Checkbox('Pose warm start', key='pose_warm_start', enable_events=True, default=detector.pose_warm_start),
+            sg.Checkbox('Show metrics', key='show_metrics', enable_events=True, default=show_metrics),
             sg.Text('Marker length (mm):'),
-            sg.Text(marker_length_mm, key='marker_length_mm'),
-            sg.InputText(key='marker_length_mm_input', size=(10, 1), justification='center', enable_events=True, default_text=marker_length_mm),
+            sg.Text(detector.marker_length_mm, key='marker_length_mm'),
+            sg.InputText(key='marker_length_mm_input', size=(10, 1), justification='center', enable_events=True, default_text=detector.marker_length_mm),
         ],
         [
             sg.Text('', key='capture_fps', size=(15, 1), justification='center', font='Helvetica 20'),
             sg.Text('', key='process_fps', size=(15, 1), justification='center', font='Helvetica 20'),
             sg.Text('', key='marker_count', size=(10, 1), justification='center', font='Helvetica 20'),
+            sg.Text('', key='queue_depths', font='Helvetica 12'),
+            sg.Text('', key='load_level', font='Helvetica 12'),
+            sg.Column([
+                [sg.Button('Export detections', key='export_detections', font='Helvetica 14', enable_events=True)],
+            ], element_justification='right', expand_x=True),
         ],
     ]
 
     window = sg.Window('ArUcoMarkerDetection', layout, location=(100, 100))
+    frame_display = FrameDisplay(window['image'])
 
-    camera_looper = CameraLooper()
+    # 管線模式：擷取、畸變修正、偵測、姿態估算與繪製分別在各自的執行緒進行
+    pipeline = None if pipeline_delivery is None else Pipeline(detector, delivery=pipeline_delivery, camera=camera, load_shedder=load_shedder)
+    camera_looper = CameraLooper(metrics=detector.metrics, camera=camera) if pipeline is None else pipeline.camera_looper
+    metrics = detector.metrics
 
     recent_frame_count = 10
     recent_frame_time = deque([0.0], maxlen=recent_frame_count)
-
-    # 鏡頭校準相關參數
-    camera_matrix, distortion_coefficients = load_coefficients()
-    if camera_matrix is None:
-        print('No "camera_matrix" in camera.yml. Use default value.')
-        camera_matrix = np.array([[2000., 0., 1280 / 2.],
-                                  [0., 2000., 720 / 2.],
-                                  [0., 0., 1.]])
-    if distortion_coefficients is None:
-        print('No "distortion_coefficients" in camera.yml. Use default value.')
-        distortion_coefficients = np.array([0., 0., 0., 0., 0.])
-
-    print('camera_matrix:\n', camera_matrix)
-    print('distortion_coefficients:\n', distortion_coefficients)
+    last_frame_seq = 0
+    last_result_seq = 0
+    # 最近一次的偵測結果；管線模式下 pose 執行緒會覆寫共用的 DetectionBuffer，GUI 只讀取結果本身
+    detections = np.zeros(0, DETECTION_DTYPE)
+    frame_wait_timeout = 0.01  # 等待新影像的時間上限，期間外仍可處理 GUI 事件
+    base_detection_scale = detector.detection_scale  # 使用者選擇的偵測解析度（降載時可能暫時調低）
 
     try:
         while True:
@@ -146,8 +118,17 @@ def main():
                 resize_size = None
             if event.startswith('Resize to '):
                 resize_size = int(event.split(' ')[-1])
+            if event.startswith('GUI refresh '):
+                render_scheduler.refresh_rate = int(event.split(' ')[-2])
             if event == 'dict_select':
-                selected_aruco_dict = ARUCO_DICT[values['dict_select']]
+                detector.aruco_dict_name = values['dict_select']
+            if event == 'preset_select':
+                detector.preset_name = values['preset_select']
+            if event == 'detection_scale':
+                base_detection_scale = float(values['detection_scale'])
+                detector.detection_scale = base_detection_scale if load_shedder is None else load_shedder.detection_scale(base_detection_scale)
+            if event == 'tiled_detection':
+                detector.tiled_detection = values['tiled_detection']
             if event == 'draw_crosshair':
                 draw_crosshair = values['draw_crosshair']
             if event == 'draw_custom_marker':
@@ -155,7 +136,15 @@ def main():
             if event == 'draw_axis':
                 draw_axis = values['draw_axis']
             if event == 'undistortion':
-                undistortion = values['undistortion']
+                detector.undistortion = values['undistortion']
+            if event == 'roi_tracking':
+                detector.roi_tracking = values['roi_tracking']
+            if event == 'flow_tracking':
+                detector.flow_tracking = values['flow_tracking']
+            if event == 'pose_warm_start':
+                detector.pose_warm_start = values['pose_warm_start']
+            if event == 'show_metrics':
+                show_metrics = values['show_metrics']
             if event == 'marker_length_mm_input':
                 marker_length_mm_input = values['marker_length_mm_input']
                 if len(marker_length_mm_input) > 7:
@@ -163,166 +152,181 @@ def main():
                 else:
                     if re.match(r'^\d*\.?\d*$', marker_length_mm_input):
                         if re.match(r'^\d+\.?\d*$', marker_length_mm_input):
-                            marker_length_mm = float(marker_length_mm_input)
+                            detector.marker_length_mm = float(marker_length_mm_input)
                     else:
-                        marker_length_mm_input = marker_length_mm
+                        marker_length_mm_input = detector.marker_length_mm
                 window['marker_length_mm_input'].update(marker_length_mm_input)
-                window['marker_length_mm'].update(marker_length_mm)
-
-            ret, frame = camera_looper.read()
-            if not ret:
-                continue
-            # reize 圖片
-            # frame = cv2.resize(frame,(640,360))
-
-            if undistortion:
-                # 畸變修正
-                h, w = frame.shape[:2]
-                new_camera_mtx, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, distortion_coefficients, (w, h), 0, (w, h))
-                # 以下兩種方案皆可達到相同效果
-                # @see https://opencv24-python-tutorials.readthedocs.io/en/latest/py_tutorials/py_calib3d/py_calibration/py_calibration.html#undistortion
-                # 方案一：undistort
-                frame = cv2.undistort(frame, camera_matrix, distortion_coefficients, None, new_camera_mtx)
-                # 方案二：initUndistortRectifyMap
-                # map_x, map_y = cv2.initUndistortRectifyMap(camera_matrix, distortion_coefficients, None, new_camera_mtx, (w, h), 5)
-                # frame = cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR)
-                # 裁剪 ROI
-                x, y, w, h = roi
-                frame = frame[y:y + h, x:x + w]
-
-            aruco_dict = aruco.Dictionary_get(selected_aruco_dict)
-            aruco_params = aruco.DetectorParameters_create()
-            (corners, ids, rejected) = aruco.detectMarkers(frame, aruco_dict, parameters=aruco_params)
-
-            window['marker_count'].update(f'{len(corners)} markers')
-
-            if len(corners) > 0:
-                # flatten the ArUco IDs list
-                ids = ids.flatten()
-
-                if not draw_custom_marker:
-                    aruco.drawDetectedMarkers(frame, corners, ids)
-
-                detected_markers = []
-                # loop over the detected ArUCo corners
-                for (markerCorner, markerID) in zip(corners, ids):
-                    # extract the marker corners (which are always returned in top-left, top-right, bottom-right, and bottom-left order)
-                    corners = markerCorner.reshape((4, 2))
-                    (top_left, top_right, bottom_right, bottom_left) = corners
-                    # convert each of the (x, y)-coordinate pairns to integers
-                    top_right = (int(top_right[0]), int(top_right[1]))
-                    bottom_right = (int(bottom_right[0]), int(bottom_right[1]))
-                    bottom_left = (int(bottom_left[0]), int(bottom_left[1]))
-                    top_left = (int(top_left[0]), int(top_left[1]))
-                    # draw the bounding box of the ArUCo detection
-                    # cv2.line(frame, top_left, top_right, (0, 255, 0), 2)
-                    # cv2.line(frame, top_right, bottom_right, (0, 255, 0), 2)
-                    # cv2.line(frame, bottom_right, bottom_left, (0, 255, 0), 2)
-                    # cv2.line(frame, bottom_left, top_left, (0, 255, 0), 2)
-
-                    # compute and draw the center (x, y)-coordinates of the ArUco marker
-                    # c_x = int((top_left[0] + bottom_right[0]) / 2.0)
-                    # c_y = int((top_left[1] + bottom_right[1]) / 2.0)
-                    # # cv2.circle(frame, (c_x, c_y), 4, (0, 0, 255), -1)
-
-                    # draw the ArUco marker ID on the frame
-                    # cv2.putText(frame, str(markerID),
-                    #             (top_left[0], top_left[1] - 15),
-                    #             cv2.FONT_HERSHEY_SIMPLEX,
-                    #             0.5, (0, 255, 0), 1)
-
-                    if draw_custom_marker:
-                        text_pad = create_text_pad(str(markerID))
-                        frame = embed_img(text_pad, frame, [top_left, bottom_left, bottom_right, top_right], alpha=0.7)
-
-                    rotation_vectors, translation_vectors, marker_points = aruco.estimatePoseSingleMarkers(markerCorner, marker_length_mm, camera_matrix, distortion_coefficients)
-                    # 繪製軸線
-                    if draw_axis:
-                        aruco.drawAxis(frame, camera_matrix, distortion_coefficients, rotation_vectors, translation_vectors, marker_length_mm / 2)
-
-                    rotation_matrix = np.eye(4)
-                    rotation_matrix[0:3, 0:3] = cv2.Rodrigues(np.array(rotation_vectors[0][0]))[0]
-                    r = R.from_matrix(rotation_matrix[0:3, 0:3])
-                    quat = r.as_quat()
-                    # 計算角度
-                    rmat, jacobian = cv2.Rodrigues(rotation_vectors)
-
-                    transform_rotation_x = quat[2]
-                    transform_rotation_y = quat[1]
-                    transform_rotation_z = quat[0]
-                    transform_rotation_w = quat[3]
-
-                    roll_x, yaw_y, pitch_z = euler_from_quaternion(transform_rotation_x,
-                                                                   transform_rotation_y,
-                                                                   transform_rotation_z,
-                                                                   transform_rotation_w)
-
-                    roll_x = math.degrees(roll_x)
-                    yaw_y = math.degrees(yaw_y)
-                    pitch_z = math.degrees(pitch_z)
-
-                    distance_cm = translation_vectors[0][0][2] / 10
-                    x_offset_cm = translation_vectors[0][0][0] / 10
-                    y_offset_cm = translation_vectors[0][0][1] / 10
-
-                    try:
-                        x_degree = math.degrees(math.asin(x_offset_cm / distance_cm))
-                    except ValueError:
-                        x_degree = 0
-
-                    try:
-                        y_degree = math.degrees(math.asin(y_offset_cm / distance_cm))
-                    except ValueError:
-                        y_degree = 0
-
-                    detected_markers.append(pd.DataFrame({
-                        'id': markerID,
-                        '偏航(yaw)': round(yaw_y),
-                        '俯仰(pitch)': round(pitch_z),
-                        '滾動(roll)': round(roll_x),
-                        '橫向偏移(cm)': round(x_offset_cm),
-                        '縱向偏移(cm)': round(y_offset_cm),
-                        '距離(cm)': round(distance_cm),
-                        '橫向角度': round(x_degree),
-                        '縱向角度': round(y_degree),
-                    }, index=[0]))
-                if detected_markers:
-                    detected_marker_df = pd.concat([empty_detected_marker_df] + detected_markers).sort_values(by=['id'])
-                else:
-                    detected_marker_df = empty_detected_marker_df
-                window['detected_marker_table'].update(values=detected_marker_df.values.tolist())
+                window['marker_length_mm'].update(detector.marker_length_mm)
+            if event == 'export_detections':
+                filename = time.strftime('detections_%Y%m%d_%H%M%S', time.localtime()) + '.csv'
+                detections_to_dataframe(detections).to_csv(filename, index=False)
+                print(f'Detections exported to {filename}')
+
+            # 降載時略過較耗時的疊圖
+            allowed_custom_marker, allowed_axis = (draw_custom_marker, draw_axis) if load_shedder is None else load_shedder.draw_options(draw_custom_marker, draw_axis)
+
+            if pipeline is not None:
+                pipeline.render_options.update(draw_crosshair=draw_crosshair, draw_custom_marker=allowed_custom_marker, draw_axis=allowed_axis)
+                result = pipeline.get_result(timeout=frame_wait_timeout)
+                if result is None:
+                    continue
+                if last_result_seq:
+                    # 降載略過的影像已計入 shed_frames，不再算入 dropped_frames
+                    last_result_seq += result.shed_frames
+                render = render_scheduler.should_render()
             else:
-                window['detected_marker_table'].update(values=empty_detected_marker_df.values.tolist())
-
-            if draw_crosshair:
-                pen_radius = max(frame.shape[0], frame.shape[1]) / 256
-                # center_x, center_y = frame.shape[1] // 2, frame.shape[0] // 2
-                # optical centers
-                center_x, center_y = camera_matrix[0][2], camera_matrix[1][2]
-                percent = max(frame.shape[0], frame.shape[1]) / 100
-                cv2.line(frame, (int(center_x), int(center_y - percent * 2)), (int(center_x), int(center_y - percent * 1)), (0, 0, 255), int(pen_radius))
-                cv2.line(frame, (int(center_x), int(center_y + percent * 1)), (int(center_x), int(center_y + percent * 2)), (0, 0, 255), int(pen_radius))
-                cv2.line(frame, (int(center_x - percent * 2), int(center_y)), (int(center_x - percent * 1), int(center_y)), (0, 0, 255), int(pen_radius))
-                cv2.line(frame, (int(center_x + percent * 1), int(center_y)), (int(center_x + percent * 2), int(center_y)), (0, 0, 255), int(pen_radius))
-                cv2.line(frame, (int(center_x), int(center_y - percent * 2)), (int(center_x), int(center_y + percent * 2)), (0, 255, 255), int(pen_radius // 3))
-                cv2.line(frame, (int(center_x - percent * 2), int(center_y)), (int(center_x + percent * 2), int(center_y)), (0, 255, 255), int(pen_radius // 3))
-
-            # img_bytes = cv2.imencode('.png', frame)[1].tobytes()
-            image = Image.fromarray(frame[:, :, ::-1])
-            if resize_size:
-                image = ImageOps.contain(image, (resize_size, resize_size))
-            img_bytes = ImageTk.PhotoImage(image=image)
-            window['image'].update(data=img_bytes)
-            window['capture_fps'].update(f'Capture: {camera_looper.fps:.1f} fps')
+                # 僅在有新影像時才處理，避免重複處理同一張影像
+                ret, frame, frame_seq = camera_looper.wait_for_frame(last_frame_seq, timeout=frame_wait_timeout)
+                if frame_seq == last_frame_seq:
+                    continue
+                last_frame_seq = frame_seq
+                if not ret:
+                    continue
+                if load_shedder is not None and not load_shedder.should_process():
+                    # 降載略過的影像已計入 shed_frames，不再算入 dropped_frames
+                    last_result_seq = frame_seq
+                    continue
+                timestamp = camera_looper.frame_timestamp(frame_seq)
+                result = detector.process(frame)
+                # 偵測以影像速率執行，畫面則依 GUI 更新頻率繪製；要繪製的影像先取出彩色影像，再一併確認未被覆寫
+                render = render_scheduler.should_render()
+                if render:
+                    detector.color_frame(result)
+                if not camera_looper.frame_intact(frame_seq):
+                    # 處理期間擷取端已覆寫此影像；不更新 last_result_seq，由 frame_done 計入 dropped_frames
+                    continue
+                # 之後不再讀取擷取緩衝區
+                result.source = None
+                result.frame_seq = frame_seq
+                result.timestamp = timestamp
+            detections = result.detections
+            if metrics is not None:
+                metrics.frame_done(result.frame_seq, last_result_seq)
+            last_result_seq = result.frame_seq
+            if load_shedder is not None and result.timestamp and load_shedder.observe(time.time() - result.timestamp):
+                detector.detection_scale = load_shedder.detection_scale(base_detection_scale)
 
             new_frame_time = time.time()
             show_fps = 1 / ((new_frame_time - recent_frame_time[0]) / recent_frame_count)
             recent_frame_time.append(new_frame_time)
-            window['process_fps'].update(f'Process: {show_fps:.1f} fps')
+
+            if not render:
+                continue
+
+            if pipeline is not None:
+                # 管線的 render 階段已完成繪製
+                frame = result.frame
+            else:
+                frame = detector.draw(result, draw_crosshair=draw_crosshair, draw_custom_marker=allowed_custom_marker, draw_axis=allowed_axis)
+
+            if show_metrics and metrics is not None:
+                frame = draw_metrics_overlay(frame, metrics)
+
+            with timed(metrics, 'convert'):
+                frame_display.update(frame, resize_size)
+
+            with timed(metrics, 'table'):
+                # 表格與文字僅在（四捨五入後的）內容改變時才更新
+                rows = table_rows(detections)
+                if render_scheduler.changed('detected_marker_table', rows):
+                    window['detected_marker_table'].update(values=rows)
+            for key, text in (
+                    ('marker_count', f'{len(detections)} markers'),
+                    ('capture_fps', f'Capture: {camera_looper.fps:.1f} fps'),
+                    ('process_fps', f'Process: {show_fps:.1f} fps'),
+                    ('load_level', '' if load_shedder is None else f'Load level {load_shedder.level_index}: {load_shedder.level.name}'),
+                    ('queue_depths', '' if pipeline is None else 'Queues: ' + ' | '.join(f'{stage} {depth}' for stage, depth in pipeline.queue_depths().items())),
+            ):
+                if render_scheduler.changed(key, text):
+                    window[key].update(text)
+            if metrics is not None:
+                # 擷取到畫面更新完成的延遲
+                metrics.record_latency(result.timestamp)
     finally:
-        camera_looper.stop()
+        if pipeline is not None:
+            pipeline.stop()
+        else:
+            camera_looper.stop()
         window.close()
 
 
+def main():
+    parser = argparse.ArgumentParser(description='Realtime ArUco marker detection.')
+    parser.add_argument('--headless', action='store_true', help='Run without GUI and stream detections of every frame.')
+    parser.add_argument('--pipeline', choices=Pipeline.DELIVERIES, help='Run undistort/detect/pose/render as a threaded pipeline, delivering results in order or latest-only (GUI only).')
+    parser.add_argument('--output', help='Output file for --headless (default: stdout).')
+    parser.add_argument('--format', choices=DetectionWriter.FORMATS, default='jsonl', help='Output format for --headless.')
+    parser.add_argument('--workers', type=int, help='Detect in this many processes sharing frames through shared memory (--headless only).')
+    parser.add_argument('--max-frames', type=int, help='Stop after this many frames (--headless only).')
+    parser.add_argument('--dict', choices=list(ARUCO_DICT.keys()), default=DEFAULT_ARUCO_DICT_NAME, help='ArUco dictionary.')
+    parser.add_argument('--preset', default=DEFAULT_DETECTOR_PRESET_NAME, help=f'Detector parameters preset defined in {DETECTOR_PRESETS_PATH} (e.g. fast, balanced, robust).')
+    parser.add_argument('--marker-length', type=float, default=DEFAULT_MARKER_LENGTH_MM, help='Marker length (mm).')
+    parser.add_argument('--calibration', default='camera.yml', help='Camera coefficients file.')
+    parser.add_argument('--no-undistortion', action='store_true', help='Disable undistortion.')
+    parser.add_argument('--roi-tracking', action='store_true', help='Search only around previously detected markers.')
+    parser.add_argument('--rescan-interval', type=int, default=30, help='Full-frame rescan interval (frames) for --roi-tracking.')
+    parser.add_argument('--flow-tracking', action='store_true', help='Track markers with optical flow between detections.')
+    parser.add_argument('--redetect-interval', type=int, default=10, help='Detection interval (frames) for --flow-tracking.')
+    parser.add_argument('--detection-scale', type=float, default=1.0, help='Detect on a copy downscaled by this factor and refine the corners at full resolution (1 = off).')
+    parser.add_argument('--tiled-detection', action='store_true', help='Split large frames into overlapping tiles detected in parallel threads.')
+    parser.add_argument('--tile-workers', type=int, help='Threads (and tiles) for --tiled-detection (default: CPU count).')
+    parser.add_argument('--tile-min-distance', type=float, default=100, help='Closest marker distance (mm) for --tiled-detection; sizes the tile overlap.')
+    parser.add_argument('--pose-warm-start', action='store_true', help="Refine each marker's pose from its pose in the previous frame.")
+    parser.add_argument('--latency-budget', type=float, help='Target end-to-end latency (ms). Overlays, detection resolution and frames are shed to hold it.')
+    parser.add_argument('--replay', help='Read frames from a recording made with recording.py instead of the camera.')
+    parser.add_argument('--replay-fast', action='store_true', help='Replay as fast as possible instead of at the original timing.')
+    parser.add_argument('--replay-loop', action='store_true', help='Restart the replay when it ends.')
+    parser.add_argument('--metrics', help='Periodically dump per-stage latency metrics to this file (Prometheus text format for *.prom, JSON otherwise).')
+    parser.add_argument('--metrics-interval', type=float, default=10, help='Seconds between --metrics dumps.')
+    args = parser.parse_args()
+    if args.workers is not None and not args.headless:
+        parser.error('--workers requires --headless')
+    if args.pipeline is not None and args.headless:
+        parser.error('--pipeline is not supported with --headless')
+
+    # 無頭模式下 stdout 僅輸出偵測結果，狀態訊息改輸出至 stderr
+    with contextlib.redirect_stdout(sys.stderr) if args.headless else contextlib.nullcontext():
+        # 鏡頭校準相關參數
+        camera_matrix, distortion_coefficients = load_coefficients_or_default(args.calibration)
+        print('camera_matrix:\n', camera_matrix)
+        print('distortion_coefficients:\n', distortion_coefficients)
+
+        detector = MarkerDetector(
+            aruco_dict_name=args.dict,
+            marker_length_mm=args.marker_length,
+            camera_matrix=camera_matrix,
+            distortion_coefficients=distortion_coefficients,
+            undistortion=not args.no_undistortion,
+            preset_name=args.preset,
+            roi_tracking=args.roi_tracking,
+            rescan_interval=args.rescan_interval,
+            flow_tracking=args.flow_tracking,
+            redetect_interval=args.redetect_interval,
+            pose_warm_start=args.pose_warm_start,
+            detection_scale=args.detection_scale,
+            tiled_detection=args.tiled_detection,
+            tile_workers=args.tile_workers,
+            tile_min_distance_mm=args.tile_min_distance,
+            metrics=PerformanceMetrics(),
+        )
+
+        load_shedder = LoadShedder(args.latency_budget / 1000, metrics=detector.metrics) if args.latency_budget else None
+        camera = ReplayCamera(args.replay, realtime=not args.replay_fast, loop=args.replay_loop) if args.replay else None
+
+    metrics_dumper = MetricsDumper(detector.metrics, args.metrics, args.metrics_interval) if args.metrics else None
+    try:
+        if not args.headless:
+            run_gui(detector, args.pipeline, camera, load_shedder)
+        elif args.output:
+            with open(args.output, 'w', newline='') as output:
+                run_headless(detector, output, args.format, args.max_frames, args.workers, camera, load_shedder)
+        else:
+            run_headless(detector, sys.stdout, args.format, args.max_frames, args.workers, camera, load_shedder)
+    finally:
+        detector.close()
+        if metrics_dumper is not None:
+            metrics_dumper.stop()
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,161 @@
+import csv
+import json
+from typing import Dict, List, Sequence, TextIO
+
+import numpy as np
+
+from pose import MarkerPoses
+
+# 單一標記的偵測結果（固定欄位型別）
+DETECTION_DTYPE = np.dtype([
+    ('id', np.int32),
+    ('corners', np.float32, (4, 2)),  # top-left, top-right, bottom-right, bottom-left
+    ('rvec', np.float64, (3,)),
+    ('tvec', np.float64, (3,)),
+    ('yaw', np.float64),
+    ('pitch', np.float64),
+    ('roll', np.float64),
+    ('x_offset_cm', np.float64),
+    ('y_offset_cm', np.float64),
+    ('distance_cm', np.float64),
+    ('x_degree', np.float64),
+    ('y_degree', np.float64),
+])
+
+# 表格欄位與顯示名稱
+TABLE_COLUMNS = {
+    'id': 'id',
+    'yaw': '偏航(yaw)',
+    'pitch': '俯仰(pitch)',
+    'roll': '滾動(roll)',
+    'x_offset_cm': '橫向偏移(cm)',
+    'y_offset_cm': '縱向偏移(cm)',
+    'distance_cm': '距離(cm)',
+    'x_degree': '橫向角度',
+    'y_degree': '縱向角度',
+}
+TABLE_HEADINGS = list(TABLE_COLUMNS.values())
+_ROUNDED_FIELDS = list(TABLE_COLUMNS.keys())[1:]
+
+
+def table_rows(detections: np.ndarray) -> List[list]:
+    """ Table rows (id and rounded pose values) of a DETECTION_DTYPE array. """
+    if len(detections) == 0:
+        return []
+    rounded = np.rint(np.column_stack([detections[field] for field in _ROUNDED_FIELDS])).astype(int)
+    return np.column_stack([detections['id'], rounded]).tolist()
+
+
+def detections_to_dataframe(detections: np.ndarray):
+    """ Copies a DETECTION_DTYPE array into a pandas DataFrame, for export only. """
+    # pandas 僅於匯出時載入，無頭與批次處理不需要
+    import pandas as pd
+
+    df = pd.DataFrame({field: detections[field] for field in TABLE_COLUMNS})
+    df['rvec'] = list(detections['rvec'])
+    df['tvec'] = list(detections['tvec'])
+    df['corners'] = [c.tolist() for c in detections['corners']]
+    return df
+
+
+class DetectionBuffer:
+    """
+    Preallocated structured-array storage for the detections of one frame.
+    `fill` writes into the existing capacity (growing it only when a frame has more markers than ever before)
+    and returns a view sorted by marker id, which is overwritten by the next `fill`.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._data = np.zeros(capacity, DETECTION_DTYPE)
+        self.count = 0
+
+    @property
+    def detections(self) -> np.ndarray:
+        return self._data[:self.count]
+
+    def clear(self) -> np.ndarray:
+        self.count = 0
+        return self.detections
+
+    def fill(self, ids: np.ndarray, corners: Sequence[np.ndarray], poses: MarkerPoses) -> np.ndarray:
+        count = len(ids)
+        if count > len(self._data):
+            self._data = np.zeros(max(count, len(self._data) * 2), DETECTION_DTYPE)
+        self.count = count
+        if count == 0:
+            return self.detections
+
+        order = np.argsort(ids, kind='stable')
+        data = self._data[:count]
+        data['id'] = ids[order]
+        data['corners'] = np.asarray(corners, np.float32).reshape(-1, 4, 2)[order]
+        data['rvec'] = poses.rvecs[order]
+        data['tvec'] = poses.tvecs[order]
+        for field in _ROUNDED_FIELDS:
+            data[field] = getattr(poses, field)[order]
+        return data
+
+
+class DetectionWriter:
+    """
+    Streams per-frame detections as JSON lines (one object per frame)
+    or CSV (one row per marker, with the frame index and timestamp).
+    """
+    FORMATS = ('jsonl', 'csv')
+    CSV_FIELDS = ['frame', 'timestamp', *TABLE_COLUMNS, 'rvec_x', 'rvec_y', 'rvec_z', 'tvec_x', 'tvec_y', 'tvec_z']
+
+    def __init__(self, stream: TextIO, output_format: str = 'jsonl'):
+        if output_format not in self.FORMATS:
+            raise ValueError(f'Unknown output format: {output_format}')
+        self.stream = stream
+        self.output_format = output_format
+        self._csv_writer = None
+        if output_format == 'csv':
+            self._csv_writer = csv.writer(stream)
+            self._csv_writer.writerow(self.CSV_FIELDS)
+
+    def write(self, frame_index: int, timestamp: float, detections: np.ndarray) -> None:
+        if self.output_format == 'csv':
+            for detection in detections:
+                self._csv_writer.writerow([
+                    frame_index, timestamp,
+                    *(detection[field].item() for field in TABLE_COLUMNS),
+                    *detection['rvec'].tolist(), *detection['tvec'].tolist(),
+                ])
+        else:
+            markers = [{
+                **{field: detection[field].item() for field in TABLE_COLUMNS},
+                'rvec': detection['rvec'].tolist(),
+                'tvec': detection['tvec'].tolist(),
+                'corners': detection['corners'].tolist(),
+            } for detection in detections]
+            self.stream.write(json.dumps({'frame': frame_index, 'timestamp': timestamp, 'markers': markers}) + '\n')
+        self.stream.flush()
+
+
+class DetectionColumns:
+    """
+    Collects per-frame detections as columns (one entry per marker, with the frame index and timestamp)
+    and saves them as an .npz file. Same `write` interface as DetectionWriter.
+    """
+
+    def __init__(self):
+        self._frames: List[np.ndarray] = []
+        self._timestamps: List[np.ndarray] = []
+        self._detections: List[np.ndarray] = []
+
+    def write(self, frame_index: int, timestamp: float, detections: np.ndarray) -> None:
+        self._frames.append(np.full(len(detections), frame_index, np.int64))
+        self._timestamps.append(np.full(len(detections), timestamp, np.float64))
+        self._detections.append(detections.copy())
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        data = np.concatenate(self._detections) if self._detections else np.zeros(0, DETECTION_DTYPE)
+        return {
+            'frame': np.concatenate(self._frames) if self._frames else np.zeros(0, np.int64),
+            'timestamp': np.concatenate(self._timestamps) if self._timestamps else np.zeros(0, np.float64),
+            **{field: data[field] for field in DETECTION_DTYPE.names},
+        }
+
+    def save(self, stream) -> None:
+        np.savez(stream, **self.columns())
@@ -0,0 +1,50 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+def fit_size(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """ Largest size with the same aspect ratio that fits in max_size x max_size (as PIL.ImageOps.contain). """
+    scale = min(max_size / width, max_size / height)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+class FrameDisplay:
+    """
+    Shows BGR frames in a PySimpleGUI Image element.
+    Each frame is resized (INTER_AREA) and converted to RGBA at display resolution into preallocated buffers,
+    then pasted into one reused PhotoImage; the PhotoImage is only re-created when the display size changes.
+    """
+
+    def __init__(self, element):
+        self.element = element
+        self._resized: Optional[np.ndarray] = None
+        self._rgba: Optional[np.ndarray] = None
+        self._image: Optional[Image.Image] = None
+        self._photo: Optional[ImageTk.PhotoImage] = None
+
+    def update(self, frame: np.ndarray, max_size: int = None) -> None:
+        height, width = frame.shape[:2]
+        size = fit_size(width, height, max_size) if max_size else (width, height)
+        if size != (width, height):
+            if self._resized is None or self._resized.shape[:2] != (size[1], size[0]):
+                self._resized = np.empty((size[1], size[0], 3), np.uint8)
+            cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+            frame = self._resized
+
+        if self._rgba is None or self._rgba.shape[:2] != (size[1], size[0]):
+            self._rgba = np.empty((size[1], size[0], 4), np.uint8)
+            # 與 numpy 緩衝區共用記憶體（RGBA 不需 PIL 轉換格式）
+            self._image = Image.frombuffer('RGBA', size, self._rgba, 'raw', 'RGBA', 0, 1)
+            self._photo = None
+        # 只在顯示解析度下轉換色彩
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+
+        if self._photo is None:
+            # 顯示尺寸改變時才建立新的 PhotoImage
+            self._photo = ImageTk.PhotoImage(self._image)
+            self.element.update(data=self._photo)
+        else:
+            self._photo.paste(self._image)
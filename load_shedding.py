@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import Sequence
+
+from metrics import PerformanceMetrics
+
+
+@dataclass(frozen=True)
+class DegradationLevel:
+    name: str
+    draw_overlays: bool = True  # draw_axis 與 draw_custom_marker
+    max_detection_scale: float = 1.0  # 偵測解析度上限（見 MarkerDetector.detection_scale）
+    frame_stride: int = 1  # 每 frame_stride 張影像只處理一張
+
+
+# 由輕到重依序降級
+DEGRADATION_LEVELS = (
+    DegradationLevel('full'),
+    DegradationLevel('no overlays', draw_overlays=False),
+    DegradationLevel('reduced resolution', draw_overlays=False, max_detection_scale=0.5),
+    DegradationLevel('skip frames', draw_overlays=False, max_detection_scale=0.5, frame_stride=2),
+    DegradationLevel('skip more frames', draw_overlays=False, max_detection_scale=0.5, frame_stride=4),
+)
+
+
+class LoadShedder:
+    """
+    Holds the end-to-end latency (capture to result) within `target_latency` seconds by stepping through `levels`.
+    The latency of each processed frame is smoothed with an exponential moving average; the level goes one step down
+    after `patience` consecutive frames over budget, and one step back up after `recovery` consecutive frames
+    under `headroom` times the budget. The `cooldown` frames following a change are not counted, since frames
+    already queued still carry the latency of the previous level.
+    """
+
+    def __init__(self, target_latency: float, levels: Sequence[DegradationLevel] = DEGRADATION_LEVELS, smoothing: float = 0.2,
+                 headroom: float = 0.6, patience: int = 5, recovery: int = 60, cooldown: int = 10, metrics: PerformanceMetrics = None):
+        self.target_latency = target_latency
+        self.levels = tuple(levels)
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.patience = patience
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.metrics = metrics
+        self.level_index = 0
+        self.latency = 0.0  # 平滑後的延遲（秒）
+        self._over_count = 0
+        self._under_count = 0
+        self._skipped_count = 0
+        self._cooldown_count = 0
+        self._set_level(0)
+
+    @property
+    def level(self) -> DegradationLevel:
+        return self.levels[self.level_index]
+
+    def _set_level(self, level_index: int) -> None:
+        self.level_index = level_index
+        self._over_count = 0
+        self._under_count = 0
+        self._cooldown_count = self.cooldown
+        if self.metrics is not None:
+            self.metrics.set_gauge('load_level', level_index)
+
+    def observe(self, latency: float) -> bool:
+        """ Records the end-to-end latency (seconds) of a processed frame; returns True if the level changed. """
+        self.latency = latency if self.latency == 0 else self.latency + self.smoothing * (latency - self.latency)
+        if self._cooldown_count > 0:
+            self._cooldown_count -= 1
+            return False
+        if self.latency > self.target_latency:
+            self._over_count += 1
+            self._under_count = 0
+        elif self.latency < self.target_latency * self.headroom:
+            self._under_count += 1
+            self._over_count = 0
+        else:
+            self._over_count = 0
+            self._under_count = 0
+
+        if self._over_count >= self.patience and self.level_index < len(self.levels) - 1:
+            self._set_level(self.level_index + 1)
+        elif self._under_count >= self.recovery and self.level_index > 0:
+            self._set_level(self.level_index - 1)
+        else:
+            return False
+        print(f'Load level {self.level_index} ({self.level.name}), latency {self.latency * 1000:.1f} ms, target {self.target_latency * 1000:.1f} ms')
+        return True
+
+    def should_process(self) -> bool:
+        """ False for the frames skipped at the current level (call once per new frame). """
+        if self._skipped_count < self.level.frame_stride - 1:
+            self._skipped_count += 1
+            if self.metrics is not None:
+                self.metrics.increment('shed_frames')
+            return False
+        self._skipped_count = 0
+        return True
+
+    def detection_scale(self, detection_scale: float) -> float:
+        """ The requested detection scale, limited by the current level. """
+        return min(detection_scale, self.level.max_detection_scale)
+
+    def draw_options(self, draw_custom_marker: bool, draw_axis: bool):
+        """ (draw_custom_marker, draw_axis) allowed at the current level. """
+        return draw_custom_marker and self.level.draw_overlays, draw_axis and self.level.draw_overlays
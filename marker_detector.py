@@ -0,0 +1,460 @@
+import contextlib
+import copy
+import json
+import os.path
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, TextIO
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from detections import DetectionBuffer, DetectionWriter
+from metrics import PerformanceMetrics, timed
+from load_shedding import LoadShedder
+from pose import PoseTracker, estimate_poses
+from multiscale import MultiScaleDetector
+from tiling import TiledDetector, marker_pixel_size
+from tracking import FlowTracker, RoiTracker
+from utils import CameraLooper, TextPadAtlas, Undistorter, embed_img, load_coefficients_or_default
+
+ARUCO_DICT = {
+    "DICT_4X4_50": aruco.DICT_4X4_50,
+    "DICT_4X4_100": aruco.DICT_4X4_100,
+    "DICT_4X4_250": aruco.DICT_4X4_250,
+    "DICT_4X4_1000": aruco.DICT_4X4_1000,
+    "DICT_5X5_50": aruco.DICT_5X5_50,
+    "DICT_5X5_100": aruco.DICT_5X5_100,
+    "DICT_5X5_250": aruco.DICT_5X5_250,
+    "DICT_5X5_1000": aruco.DICT_5X5_1000,
+    "DICT_6X6_50": aruco.DICT_6X6_50,
+    "DICT_6X6_100": aruco.DICT_6X6_100,
+    "DICT_6X6_250": aruco.DICT_6X6_250,
+    "DICT_6X6_1000": aruco.DICT_6X6_1000,
+    "DICT_7X7_50": aruco.DICT_7X7_50,
+    "DICT_7X7_100": aruco.DICT_7X7_100,
+    "DICT_7X7_250": aruco.DICT_7X7_250,
+    "DICT_7X7_1000": aruco.DICT_7X7_1000,
+    "DICT_ARUCO_ORIGINAL": aruco.DICT_ARUCO_ORIGINAL,
+    "DICT_APRILTAG_16h5": aruco.DICT_APRILTAG_16h5,
+    "DICT_APRILTAG_25h9": aruco.DICT_APRILTAG_25h9,
+    "DICT_APRILTAG_36h10": aruco.DICT_APRILTAG_36h10,
+    "DICT_APRILTAG_36h11": aruco.DICT_APRILTAG_36h11
+}
+
+DEFAULT_ARUCO_DICT_NAME = 'DICT_6X6_1000'
+DEFAULT_MARKER_LENGTH_MM = 21
+
+# 偵測參數預設組合（未列出的參數沿用 OpenCV 預設值）
+# 可於 DETECTOR_PRESETS_PATH 中修改或新增，檔案內容會覆蓋同名預設組合
+DETECTOR_PRESETS_PATH = 'detector_presets.json'
+DEFAULT_DETECTOR_PRESET_NAME = 'balanced'
+DEFAULT_DETECTOR_PRESETS = {
+    # 速度優先：較少的門檻化次數、ArUco3 縮小影像偵測、不做角點細化
+    'fast': {
+        'adaptiveThreshWinSizeMin': 3,
+        'adaptiveThreshWinSizeMax': 23,
+        'adaptiveThreshWinSizeStep': 20,
+        'useAruco3Detection': True,
+        'minMarkerLengthRatioOriginalImg': 0.02,
+        'minSideLengthCanonicalImg': 16,
+        'cornerRefinementMethod': aruco.CORNER_REFINE_NONE,
+    },
+    # OpenCV 預設值
+    'balanced': {},
+    # 辨識率優先：更多門檻化次數、接受更小的標記、次像素角點細化
+    'robust': {
+        'adaptiveThreshWinSizeMin': 3,
+        'adaptiveThreshWinSizeMax': 33,
+        'adaptiveThreshWinSizeStep': 4,
+        'minMarkerPerimeterRate': 0.01,
+        'polygonalApproxAccuracyRate': 0.05,
+        'perspectiveRemovePixelPerCell': 8,
+        'cornerRefinementMethod': aruco.CORNER_REFINE_SUBPIX,
+    },
+}
+
+
+def detector_parameter_names() -> List[str]:
+    """ Names of every attribute of cv2.aruco.DetectorParameters in the installed OpenCV. """
+    aruco_params = aruco.DetectorParameters_create()
+    return [name for name in dir(aruco_params) if not name.startswith('_') and not callable(getattr(aruco_params, name))]
+
+
+def create_detector_parameters(preset: Dict[str, Any]):
+    aruco_params = aruco.DetectorParameters_create()
+    for name, value in preset.items():
+        if not hasattr(aruco_params, name):
+            print(f'Unknown DetectorParameters attribute "{name}" ignored.')
+            continue
+        setattr(aruco_params, name, value)
+    return aruco_params
+
+
+def load_detector_presets(path: str = DETECTOR_PRESETS_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the detector presets from `path` (if it exists), on top of DEFAULT_DETECTOR_PRESETS.
+    """
+    presets = copy.deepcopy(DEFAULT_DETECTOR_PRESETS)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            presets.update(json.load(f))
+    return presets
+
+
+def save_detector_presets(presets: Dict[str, Dict[str, Any]], path: str = DETECTOR_PRESETS_PATH) -> None:
+    """ Saves the presets with the complete (resolved) DetectorParameters set for each one. """
+    names = detector_parameter_names()
+    resolved = {}
+    for preset_name, preset in presets.items():
+        aruco_params = create_detector_parameters(preset)
+        resolved[preset_name] = {name: getattr(aruco_params, name) for name in names}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resolved, f, indent=2)
+    print(f'Detector presets saved to {path}')
+
+
+class DetectorRegistry:
+    """
+    Builds each ArUco dictionary and each DetectorParameters preset once and hands out the cached instances.
+    """
+
+    def __init__(self, presets: Dict[str, Dict[str, Any]] = None):
+        self.presets = load_detector_presets() if presets is None else presets
+        self._dictionaries = {}
+        self._parameters = {}
+        self._text_pad_atlases = {}
+
+    def dictionary(self, aruco_dict_name: str):
+        if aruco_dict_name not in self._dictionaries:
+            self._dictionaries[aruco_dict_name] = aruco.Dictionary_get(ARUCO_DICT[aruco_dict_name])
+        return self._dictionaries[aruco_dict_name]
+
+    def text_pad_atlas(self, aruco_dict_name: str) -> TextPadAtlas:
+        """ ID text pads for the markers of the dictionary, drawn by `MarkerDetector.draw(draw_custom_marker=True)`. """
+        if aruco_dict_name not in self._text_pad_atlases:
+            self._text_pad_atlases[aruco_dict_name] = TextPadAtlas(self.dictionary(aruco_dict_name).bytesList.shape[0])
+        return self._text_pad_atlases[aruco_dict_name]
+
+    def parameters(self, preset_name: str):
+        if preset_name not in self._parameters:
+            if preset_name not in self.presets:
+                raise ValueError(f'Unknown detector preset: {preset_name}')
+            self._parameters[preset_name] = create_detector_parameters(self.presets[preset_name])
+        return self._parameters[preset_name]
+
+
+@dataclass
+class DetectionResult:
+    frame: np.ndarray  # 經畸變修正（若啟用）的彩色影像；於繪製時才由 source 產生（見 MarkerDetector.color_frame）
+    corners: Sequence[np.ndarray]  # detectMarkers 回傳的原始角點
+    ids: np.ndarray  # 與 corners 順序相同的 ID
+    detections: np.ndarray  # DETECTION_DTYPE，依 ID 排序（下一次 process 時會被覆寫）
+    frame_seq: int = 0
+    timestamp: float = 0.0  # 擷取時間（time.time()）
+    source: np.ndarray = None  # 擷取的原始彩色影像
+    gray: np.ndarray = None  # 經畸變修正（若啟用）後用於偵測的灰階影像
+    shed_frames: int = 0  # 此影像之前因降載而略過的影像數（管線模式）
+
+
+class MarkerDetector:
+    """
+    GUI-free ArUco detection engine.
+    `process` takes one BGR frame and returns the structured detections;
+    `draw` renders the optional overlays onto the processed frame.
+    """
+
+    def __init__(self, aruco_dict_name: str = DEFAULT_ARUCO_DICT_NAME, marker_length_mm: float = DEFAULT_MARKER_LENGTH_MM,
+                 camera_matrix: np.ndarray = None, distortion_coefficients: np.ndarray = None, undistortion: bool = True,
+                 preset_name: str = DEFAULT_DETECTOR_PRESET_NAME, registry: DetectorRegistry = None,
+                 roi_tracking: bool = False, rescan_interval: int = 30, flow_tracking: bool = False, redetect_interval: int = 10,
+                 pose_warm_start: bool = False, detection_scale: float = 1.0, tiled_detection: bool = False, tile_workers: int = None,
+                 tile_min_distance_mm: float = 100, metrics: PerformanceMetrics = None):
+        if camera_matrix is None or distortion_coefficients is None:
+            camera_matrix, distortion_coefficients = load_coefficients_or_default()
+        self.registry = DetectorRegistry() if registry is None else registry
+        self.aruco_dict_name = aruco_dict_name
+        self.preset_name = preset_name
+        self.marker_length_mm = marker_length_mm
+        self.camera_matrix = camera_matrix
+        self.distortion_coefficients = distortion_coefficients
+        self.undistortion = undistortion
+        self.undistorter = Undistorter(camera_matrix, distortion_coefficients)
+        self.detection_buffer = DetectionBuffer()
+        # 各階段耗時與計數統計（None 表示不記錄）
+        self.metrics = metrics
+        # ROI 追蹤：只在前一張影像的標記附近搜尋
+        self.roi_tracking = roi_tracking
+        self.roi_tracker = RoiTracker(rescan_interval=rescan_interval, metrics=metrics)
+        # 光流追蹤：兩次偵測之間以光流推算角點位置
+        self.flow_tracking = flow_tracking
+        self.flow_tracker = FlowTracker(redetect_interval=redetect_interval, metrics=metrics)
+        # 多尺度偵測：於縮小的影像上偵測，再於原影像上細化角點（detection_scale 為 1 時停用）
+        self.multiscale_detector = MultiScaleDetector(scale=detection_scale, metrics=metrics)
+        # 分塊偵測：將大影像切成重疊的區塊，以多執行緒平行偵測；重疊寬度依標記在最近距離時的大小決定
+        self.tiled_detection = tiled_detection
+        self.tile_min_distance_mm = tile_min_distance_mm
+        self.tiled_detector = TiledDetector(workers=tile_workers, metrics=metrics)
+        # 姿態暖啟動：以前一張影像的姿態作為初始值
+        self.pose_warm_start = pose_warm_start
+        self.pose_tracker = PoseTracker(metrics=metrics)
+        self._tracking_key = None
+
+    @property
+    def aruco_dict_name(self) -> str:
+        return self._aruco_dict_name
+
+    @aruco_dict_name.setter
+    def aruco_dict_name(self, aruco_dict_name: str) -> None:
+        # 僅在字典改變時才向 registry 取得（已快取的）字典
+        self._aruco_dict_name = aruco_dict_name
+        self.aruco_dict = self.registry.dictionary(aruco_dict_name)
+
+    @property
+    def detection_scale(self) -> float:
+        return self.multiscale_detector.scale
+
+    @detection_scale.setter
+    def detection_scale(self, detection_scale: float) -> None:
+        self.multiscale_detector.scale = detection_scale
+        self.multiscale_detector.reset()
+
+    @property
+    def preset_name(self) -> str:
+        return self._preset_name
+
+    @preset_name.setter
+    def preset_name(self, preset_name: str) -> None:
+        self._preset_name = preset_name
+        self.aruco_params = self.registry.parameters(preset_name)
+
+    def settings(self) -> Dict[str, Any]:
+        """ Picklable constructor arguments, for re-creating an equivalent detector in another process. """
+        return {
+            'aruco_dict_name': self.aruco_dict_name,
+            'marker_length_mm': self.marker_length_mm,
+            'camera_matrix': self.camera_matrix,
+            'distortion_coefficients': self.distortion_coefficients,
+            'undistortion': self.undistortion,
+            'preset_name': self.preset_name,
+            'pose_warm_start': self.pose_warm_start,
+            'detection_scale': self.detection_scale,
+            'tiled_detection': self.tiled_detection,
+            'tile_workers': self.tiled_detector.workers,
+            'tile_min_distance_mm': self.tile_min_distance_mm,
+            'presets': self.registry.presets,
+        }
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'MarkerDetector':
+        """ Re-creates a detector from `settings()`, e.g. in a worker process. """
+        settings = dict(settings)
+        registry = DetectorRegistry(settings.pop('presets'))
+        return cls(registry=registry, **settings)
+
+    def close(self) -> None:
+        """ Stops the tiled detection threads (if started). """
+        self.tiled_detector.close()
+
+    def _detect_aruco(self, image: np.ndarray):
+        (corners, ids, rejected) = aruco.detectMarkers(image, self.aruco_dict, parameters=self.aruco_params)
+        return corners, ids
+
+    def _detect_image(self, image: np.ndarray, scale: float = 1.0):
+        if not self.tiled_detection:
+            return self._detect_aruco(image)
+        max_marker_px = marker_pixel_size(self.marker_length_mm, self.camera_matrix, self.tile_min_distance_mm) * scale
+        return self.tiled_detector.detect(image, self._detect_aruco, max_marker_px)
+
+    def _detect_scaled_image(self, image: np.ndarray):
+        return self._detect_image(image, self.detection_scale)
+
+    def _detect_full_frame(self, image: np.ndarray):
+        if self.detection_scale >= 1:
+            return self._detect_image(image)
+        return self.multiscale_detector.detect(image, self._detect_image, self._detect_scaled_image)
+
+    def detect_markers(self, frame: np.ndarray):
+        """ Returns (corners, ids) in the same format as aruco.detectMarkers. """
+        with timed(self.metrics, 'detect'):
+            if not self.roi_tracking and not self.flow_tracking:
+                return self._detect_full_frame(frame)
+            # 影像尺寸或偵測設定改變時，先前的追蹤結果已不適用
+            tracking_key = (frame.shape, self.aruco_dict_name, self.preset_name, self.undistortion, self.roi_tracking, self.flow_tracking)
+            if tracking_key != self._tracking_key:
+                self.roi_tracker.reset()
+                self.flow_tracker.reset()
+                self._tracking_key = tracking_key
+            detect_fn = self._detect_roi if self.roi_tracking else self._detect_full_frame
+            if self.flow_tracking:
+                return self.flow_tracker.detect(frame, detect_fn)
+            return detect_fn(frame)
+
+    def _detect_roi(self, image: np.ndarray):
+        return self.roi_tracker.detect(image, self._detect_full_frame)
+
+    def undistort(self, frame: np.ndarray) -> np.ndarray:
+        if not self.undistortion:
+            return frame
+        # 畸變修正
+        # 映射表只在影像尺寸或校準係數改變時重建，效果等同 cv2.undistort
+        # @see https://opencv24-python-tutorials.readthedocs.io/en/latest/py_tutorials/py_calib3d/py_calibration/py_calibration.html#undistortion
+        with timed(self.metrics, 'undistort'):
+            return self.undistorter.undistort(frame)
+
+    @staticmethod
+    def luma(frame: np.ndarray) -> np.ndarray:
+        """ Grayscale plane used for detection (the same conversion aruco.detectMarkers does internally). """
+        return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def color_frame(self, result: DetectionResult) -> np.ndarray:
+        """ Undistorts (or copies) the color frame of `result` on first use, so that drawing never writes into `source`. """
+        if result.frame is None and result.source is not None:
+            frame = self.undistort(result.source)
+            # 未修正畸變時 source 可能是擷取緩衝區的一格，複製後再繪製
+            result.frame = frame.copy() if frame is result.source else frame
+        return result.frame
+
+    def estimate(self, corners, ids) -> DetectionResult:
+        """ Pose estimation for the output of `detect_markers`; the caller fills in the frames. """
+        with timed(self.metrics, 'pose'):
+            if len(corners) > 0:
+                # flatten the ArUco IDs list
+                ids = ids.flatten()
+                if self.pose_warm_start:
+                    poses = self.pose_tracker.estimate(ids, corners, self.marker_length_mm, self.camera_matrix, self.distortion_coefficients)
+                else:
+                    # 一次估算所有標記的姿態與角度
+                    poses = estimate_poses(corners, self.marker_length_mm, self.camera_matrix, self.distortion_coefficients)
+                detections = self.detection_buffer.fill(ids, corners, poses)
+            else:
+                ids = np.zeros(0, np.int32)
+                detections = self.detection_buffer.clear()
+
+        return DetectionResult(frame=None, corners=corners, ids=ids, detections=detections)
+
+    def process(self, frame: np.ndarray) -> DetectionResult:
+        """
+        Detects markers on the undistorted luma plane only.
+        The color frame is undistorted later, and only if it is drawn (see `color_frame`);
+        `source` refers to `frame` until then.
+        """
+        gray = self.undistort(self.luma(frame))
+        (corners, ids) = self.detect_markers(gray)
+        result = self.estimate(corners, ids)
+        result.source = frame
+        result.gray = gray
+        return result
+
+    def draw(self, result: DetectionResult, draw_crosshair: bool = True, draw_custom_marker: bool = False, draw_axis: bool = False) -> np.ndarray:
+        with timed(self.metrics, 'overlay'):
+            return self._draw(result, draw_crosshair, draw_custom_marker, draw_axis)
+
+    def _draw(self, result: DetectionResult, draw_crosshair: bool, draw_custom_marker: bool, draw_axis: bool) -> np.ndarray:
+        frame = self.color_frame(result)
+        if len(result.detections) > 0:
+            if not draw_custom_marker:
+                aruco.drawDetectedMarkers(frame, result.corners, result.ids)
+
+            if draw_custom_marker or draw_axis:
+                text_pad_atlas = self.registry.text_pad_atlas(self.aruco_dict_name) if draw_custom_marker else None
+                # loop over the detected ArUCo markers (drawing only)
+                for detection in result.detections:
+                    if draw_custom_marker:
+                        # marker corners are always in top-left, top-right, bottom-right, and bottom-left order
+                        (top_left, top_right, bottom_right, bottom_left) = detection['corners']
+                        # 只在標記的外接矩形內合成，直接寫入 frame
+                        embed_img(text_pad_atlas[int(detection['id'])], frame, [top_left, bottom_left, bottom_right, top_right], alpha=0.7)
+                    # 繪製軸線
+                    if draw_axis:
+                        aruco.drawAxis(frame, self.camera_matrix, self.distortion_coefficients, detection['rvec'], detection['tvec'], self.marker_length_mm / 2)
+
+        if draw_crosshair:
+            pen_radius = max(frame.shape[0], frame.shape[1]) / 256
+            # center_x, center_y = frame.shape[1] // 2, frame.shape[0] // 2
+            # optical centers
+            center_x, center_y = self.camera_matrix[0][2], self.camera_matrix[1][2]
+            percent = max(frame.shape[0], frame.shape[1]) / 100
+            cv2.line(frame, (int(center_x), int(center_y - percent * 2)), (int(center_x), int(center_y - percent * 1)), (0, 0, 255), int(pen_radius))
+            cv2.line(frame, (int(center_x), int(center_y + percent * 1)), (int(center_x), int(center_y + percent * 2)), (0, 0, 255), int(pen_radius))
+            cv2.line(frame, (int(center_x - percent * 2), int(center_y)), (int(center_x - percent * 1), int(center_y)), (0, 0, 255), int(pen_radius))
+            cv2.line(frame, (int(center_x + percent * 1), int(center_y)), (int(center_x + percent * 2), int(center_y)), (0, 0, 255), int(pen_radius))
+            cv2.line(frame, (int(center_x), int(center_y - percent * 2)), (int(center_x), int(center_y + percent * 2)), (0, 255, 255), int(pen_radius // 3))
+            cv2.line(frame, (int(center_x - percent * 2), int(center_y)), (int(center_x + percent * 2), int(center_y)), (0, 255, 255), int(pen_radius // 3))
+
+        return frame
+
+
+def run_headless(detector: MarkerDetector, output: TextIO, output_format: str = 'jsonl', max_frames: int = None, workers: int = None,
+                 camera=None, load_shedder: LoadShedder = None) -> None:
+    """
+    Streams the detections of every captured frame to `output` until interrupted, or until a replayed `camera` ends.
+    With `workers`, frames are shared with a pool of detector processes through shared memory.
+    With `load_shedder`, the detection resolution is lowered and frames are skipped to hold its latency budget (not with `workers`).
+    Status messages are redirected to stderr so that stdout only carries results.
+    """
+    writer = DetectionWriter(output, output_format)
+    processed_count = 0
+    with contextlib.redirect_stdout(sys.stderr):
+        if workers is not None:
+            if load_shedder is not None:
+                print('Load shedding is not supported with worker processes, ignored.')
+            from shm_workers import SharedMemoryDetectorPool
+            pool = SharedMemoryDetectorPool(detector.settings(), workers=workers, metrics=detector.metrics, camera=camera)
+            last_frame_seq = 0
+            try:
+                while max_frames is None or processed_count < max_frames:
+                    result = pool.get_result(timeout=0.1)
+                    if result is None:
+                        if pool.finished:
+                            break
+                        continue
+                    writer.write(*result)
+                    processed_count += 1
+                    if detector.metrics is not None:
+                        detector.metrics.frame_done(result[0], last_frame_seq, result[1])
+                    last_frame_seq = result[0]
+            except KeyboardInterrupt:
+                pass
+            finally:
+                pool.stop()
+                print(f'Processed {processed_count} frames, dropped {pool.dropped_frame_count}')
+            return
+
+        # keep_n：處理稍慢時依序補上，處理期間已被覆寫的影像則捨棄；重播時擷取端等待處理，完全不丟棄影像
+        drop_policy = 'block' if camera is not None and camera.finite else 'keep_n'
+        camera_looper = CameraLooper(drop_policy=drop_policy, metrics=detector.metrics, camera=camera)
+        last_frame_seq = 0
+        base_detection_scale = detector.detection_scale
+        try:
+            while max_frames is None or processed_count < max_frames:
+                ret, frame, frame_seq = camera_looper.wait_for_frame(last_frame_seq, timeout=0.1)
+                if frame_seq == last_frame_seq:
+                    if camera_looper.finished and camera_looper.frame_seq == last_frame_seq:
+                        break
+                    continue
+                if not ret or (load_shedder is not None and not load_shedder.should_process()):
+                    last_frame_seq = frame_seq
+                    continue
+                timestamp = camera_looper.frame_timestamp(frame_seq)
+                result = detector.process(frame)
+                if not camera_looper.frame_intact(frame_seq):
+                    # 處理期間擷取端已覆寫此影像，結果不可信
+                    if detector.metrics is not None:
+                        detector.metrics.increment('dropped_frames')
+                    last_frame_seq = frame_seq
+                    continue
+                writer.write(frame_seq, timestamp, result.detections)
+                processed_count += 1
+                if detector.metrics is not None:
+                    detector.metrics.frame_done(frame_seq, last_frame_seq, timestamp)
+                last_frame_seq = frame_seq
+                if load_shedder is not None and timestamp and load_shedder.observe(time.time() - timestamp):
+                    detector.detection_scale = load_shedder.detection_scale(base_detection_scale)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            camera_looper.stop()
+            print(f'Processed {processed_count} frames, dropped {camera_looper.dropped_frame_count}')
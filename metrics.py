@@ -0,0 +1,217 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+# 各處理階段；end_to_end 為擷取到顯示（或輸出）的總延遲
+STAGES = ('grab_wait', 'capture', 'undistort', 'detect', 'pose', 'overlay', 'table', 'convert', 'end_to_end')
+COUNTERS = (
+    'frames', 'dropped_frames', 'shed_frames', 'stale_frames', 'dropped_results',
+    # 各偵測與姿態估算路徑的執行次數
+    'roi_full_scans', 'roi_scans', 'flow_detections', 'flow_tracks', 'pose_solves', 'pose_refines',
+    'full_resolution_scans', 'downscaled_scans', 'tiled_scans', 'single_tile_scans',
+)
+QUANTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram of durations in nanoseconds.
+    Buckets are log-spaced from 1 µs to 100 s (20 per decade, ~12% resolution), so memory and
+    recording cost stay constant no matter how long the program runs.
+    """
+    BUCKET_EDGES_NS = np.logspace(3, 11, 8 * 20 + 1).tolist()
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.BUCKET_EDGES_NS) + 1, np.int64)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns: int) -> None:
+        self.counts[bisect.bisect_left(self.BUCKET_EDGES_NS, duration_ns)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        self.max_ns = max(self.max_ns, duration_ns)
+
+    def percentile(self, percent: float) -> float:
+        """ Upper bound (ns) of the bucket holding the given percentile, 0 if nothing was recorded. """
+        if self.count == 0:
+            return 0.0
+        rank = max(int(np.ceil(percent / 100 * self.count)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        if index >= len(self.BUCKET_EDGES_NS):
+            return float(self.max_ns)
+        return min(self.BUCKET_EDGES_NS[index], float(self.max_ns))
+
+    def mean(self) -> float:
+        return self.total_ns / self.count if self.count else 0.0
+
+
+class PerformanceMetrics:
+    """
+    Per-stage latency histograms (perf_counter_ns), frame counters and current-value gauges, shared by every thread of the detector.
+    """
+
+    def __init__(self, stages=STAGES):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.histograms: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in stages}
+        self.counters: Dict[str, int] = {counter: 0 for counter in COUNTERS}
+        self.gauges: Dict[str, float] = {}
+
+    def record(self, stage: str, duration_ns: int) -> None:
+        with self._lock:
+            self.histograms[stage].record(duration_ns)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter_ns() - start)
+
+    def record_latency(self, capture_timestamp: float) -> None:
+        """ Records the end-to-end latency of a frame captured at `capture_timestamp` (time.time()). """
+        if capture_timestamp:
+            self.record('end_to_end', int((time.time() - capture_timestamp) * 1e9))
+
+    def frame_done(self, frame_seq: int, last_frame_seq: int, capture_timestamp: float = 0.0) -> None:
+        """ Counts a processed frame, the frames skipped since `last_frame_seq`, and (if given) its end-to-end latency. """
+        self.increment('frames')
+        if last_frame_seq:
+            self.increment('dropped_frames', frame_seq - last_frame_seq - 1)
+        self.record_latency(capture_timestamp)
+
+    def increment(self, counter: str, n: int = 1) -> None:
+        if n <= 0:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def set_gauge(self, gauge: str, value: float) -> None:
+        with self._lock:
+            self.gauges[gauge] = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.histograms = {stage: LatencyHistogram() for stage in self.histograms}
+            self.counters = {counter: 0 for counter in self.counters}
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                stage_summary = {'count': histogram.count, 'mean_ms': histogram.mean() / 1e6}
+                for quantile in QUANTILES:
+                    stage_summary[f'p{quantile}_ms'] = histogram.percentile(quantile) / 1e6
+                stage_summary['max_ms'] = histogram.max_ns / 1e6
+                stages[stage] = stage_summary
+            return {
+                'uptime_s': time.time() - self.started_at,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'stages': stages,
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """ Prometheus text exposition format (stage latencies as summaries, in seconds). """
+        summary = self.summary()
+        lines = [
+            '# HELP aruco_stage_latency_seconds Processing latency of each stage.',
+            '# TYPE aruco_stage_latency_seconds summary',
+        ]
+        with self._lock:
+            totals = {stage: (histogram.total_ns, histogram.count) for stage, histogram in self.histograms.items()}
+        for stage, stage_summary in summary['stages'].items():
+            for quantile in QUANTILES:
+                lines.append(f'aruco_stage_latency_seconds{{stage="{stage}",quantile="{quantile / 100}"}} {stage_summary[f"p{quantile}_ms"] / 1e3:.9f}')
+            total_ns, count = totals[stage]
+            lines.append(f'aruco_stage_latency_seconds_sum{{stage="{stage}"}} {total_ns / 1e9:.9f}')
+            lines.append(f'aruco_stage_latency_seconds_count{{stage="{stage}"}} {count}')
+        for counter, value in summary['counters'].items():
+            lines.append(f'# TYPE aruco_{counter}_total counter')
+            lines.append(f'aruco_{counter}_total {value}')
+        for gauge, value in summary['gauges'].items():
+            lines.append(f'# TYPE aruco_{gauge} gauge')
+            lines.append(f'aruco_{gauge} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        """ Writes the metrics to `path`; Prometheus text format for .prom files, JSON otherwise. """
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        # 先寫入暫存檔再取代，避免監控程式讀到寫到一半的檔案
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def overlay_lines(self) -> List[str]:
+        summary = self.summary()
+        lines = [f'{"stage":<10} {"p50":>7} {"p95":>7} {"p99":>7} ms']
+        for stage, stage_summary in summary['stages'].items():
+            if stage_summary['count']:
+                lines.append(f'{stage:<10} {stage_summary["p50_ms"]:7.2f} {stage_summary["p95_ms"]:7.2f} {stage_summary["p99_ms"]:7.2f}')
+        lines.append(f'frames {summary["counters"]["frames"]}  dropped {summary["counters"]["dropped_frames"]}  shed {summary["counters"]["shed_frames"]}')
+        for gauge, value in summary['gauges'].items():
+            lines.append(f'{gauge} {value:g}')
+        return lines
+
+
+def timed(metrics: PerformanceMetrics, stage: str):
+    """ metrics.timer(stage), or a no-op when metrics are disabled. """
+    return contextlib.nullcontext() if metrics is None else metrics.timer(stage)
+
+
+def count(metrics: PerformanceMetrics, counter: str, n: int = 1) -> None:
+    """ metrics.increment(counter, n), or a no-op when metrics are disabled. """
+    if metrics is not None:
+        metrics.increment(counter, n)
+
+
+def draw_metrics_overlay(frame: np.ndarray, metrics: PerformanceMetrics) -> np.ndarray:
+    lines = metrics.overlay_lines()
+    font_scale = 1
+    line_height = 16
+    width = max(len(line) for line in lines) * 10 + 10
+    height = len(lines) * line_height + 8
+    # 半透明背景
+    background = frame[:height, :width]
+    background[:] = background // 3
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (5, (i + 1) * line_height), cv2.FONT_HERSHEY_PLAIN, font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+
+class MetricsDumper(threading.Thread):
+    """ Periodically dumps the metrics to a JSON or Prometheus text file (see PerformanceMetrics.dump). """
+
+    def __init__(self, metrics: PerformanceMetrics, path: str, interval: float = 10.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self.start()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.metrics.dump(self.path)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        # 結束前輸出最後一次
+        self.metrics.dump(self.path)
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from metrics import PerformanceMetrics, count
+from tracking import DetectFunction
+
+
+class MultiScaleDetector:
+    """
+    Coarse-to-fine detection for high-resolution frames.
+    Markers are detected on a copy downscaled by `scale`, then their corners are scaled back
+    and refined with cornerSubPix on the full-resolution image, inside a small window around each corner.
+    Falls back to a full-resolution detection when a marker found in the downscaled image is smaller than
+    `min_marker_px` (smaller ones are likely missed there), and every `full_scan_interval` frames (0 disables).
+    """
+
+    def __init__(self, scale: float = 0.5, min_marker_px: float = 16, full_scan_interval: int = 30, refine_window: Optional[int] = None,
+                 metrics: PerformanceMetrics = None):
+        self.scale = scale
+        self.min_marker_px = min_marker_px
+        self.full_scan_interval = full_scan_interval
+        self.refine_window = refine_window  # 細化視窗半徑，None 表示依 scale 決定
+        self.criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+        self.metrics = metrics  # 原解析度與縮小影像的偵測次數
+        self.frames_since_full_scan = 0
+
+    def reset(self) -> None:
+        self.frames_since_full_scan = 0
+
+    def _full_scan(self, frame: np.ndarray, detect_fn: DetectFunction):
+        self.frames_since_full_scan = 0
+        count(self.metrics, 'full_resolution_scans')
+        return detect_fn(frame)
+
+    def detect(self, frame: np.ndarray, detect_fn: DetectFunction, scaled_detect_fn: Optional[DetectFunction] = None):
+        """ `scaled_detect_fn` (default: `detect_fn`) is used on the downscaled image. """
+        if self.scale >= 1 or (self.full_scan_interval and self.frames_since_full_scan >= self.full_scan_interval):
+            return self._full_scan(frame, detect_fn)
+
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        corners, ids = (scaled_detect_fn or detect_fn)(small)
+        if ids is None or len(corners) == 0:
+            self.frames_since_full_scan += 1
+            count(self.metrics, 'downscaled_scans')
+            return corners, ids
+
+        small_corners = np.asarray(corners, np.float32).reshape(-1, 4, 2)
+        sides = np.linalg.norm(small_corners - np.roll(small_corners, 1, axis=1), axis=2).min(axis=1)
+        if sides.min() < self.min_marker_px:
+            return self._full_scan(frame, detect_fn)
+
+        # 以像素中心為座標換算回原影像，再於原影像上細化角點
+        full_corners = (small_corners + 0.5) / self.scale - 0.5
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        # 視窗須涵蓋縮小影像一個像素在原影像中的範圍，但小於標記的一格（避免對到內部角點）
+        window = self.refine_window or max(int(np.ceil(1 / self.scale)) + 1, 3)
+        window = min(window, max(int(sides.min() / self.scale / 10), 1))
+        points = full_corners.reshape(-1, 1, 2)
+        cv2.cornerSubPix(gray, points, (window, window), (-1, -1), self.criteria)
+        self.frames_since_full_scan += 1
+        count(self.metrics, 'downscaled_scans')
+        return tuple(c.reshape(1, 4, 2) for c in points.reshape(-1, 4, 2)), ids
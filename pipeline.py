@@ -0,0 +1,174 @@
+import queue
+import threading
+from typing import Callable, Dict, Optional
+
+from load_shedding import LoadShedder
+from marker_detector import DetectionResult, MarkerDetector
+from metrics import count
+from utils import CameraLooper
+
+
+class Pipeline:
+    """
+    Staged detection pipeline: capture -> undistort -> detect -> pose -> render.
+    Detection only uses the undistorted luma plane.
+    Every stage runs on its own worker thread (OpenCV releases the GIL in the heavy calls),
+    with bounded queues in between and the capture sequence number carried through.
+    With a `load_shedder`, frames skipped at the current level are dropped before entering the pipeline.
+    The capture thread keeps overwriting its ring while frames wait for the undistort stage; frames overwritten
+    before they were undistorted are dropped there (their sequence numbers are skipped in the results).
+    delivery:
+      'in_order' - every result is delivered, in capture order (the render stage blocks when the consumer lags).
+      'latest'   - only the newest result is kept for the consumer, older ones are dropped.
+    """
+    STAGES = ('undistort', 'detect', 'pose', 'render')
+    DELIVERIES = ('in_order', 'latest')
+
+    def __init__(self, detector: MarkerDetector, queue_size: int = 2, delivery: str = 'latest', camera_looper: CameraLooper = None, camera=None,
+                 load_shedder: LoadShedder = None):
+        if delivery not in self.DELIVERIES:
+            raise ValueError(f'Unknown delivery mode: {delivery}')
+        self.detector = detector
+        self.delivery = delivery
+        self.load_shedder = load_shedder
+        self.render_options = {'draw_crosshair': True, 'draw_custom_marker': False, 'draw_axis': False}
+        self.is_running = True
+        self._pending_shed_frames = 0  # 被捨棄影像之前降載略過的影像數，轉給下一張影像
+
+        # 畸變修正後的影像（灰階與彩色）在管線中最多同時存在於各佇列及各階段，緩衝區數量需足以涵蓋；
+        # 擷取緩衝區則由擷取執行緒持續覆寫，只在畸變修正階段讀取並檢查
+        max_frames_in_flight = len(self.STAGES) * (queue_size + 1) + 2
+        self.detector.undistorter.buffer_count = max_frames_in_flight
+        self._owns_camera_looper = camera_looper is None
+        self.camera_looper = CameraLooper(buffer_size=max_frames_in_flight + 2, metrics=detector.metrics, camera=camera) if camera_looper is None else camera_looper
+
+        self.queues: Dict[str, queue.Queue] = {stage: queue.Queue(maxsize=queue_size) for stage in self.STAGES}
+        self._output = queue.Queue(maxsize=queue_size)
+        self._latest: Optional[DetectionResult] = None
+        self._latest_condition = threading.Condition()
+
+        stage_functions = {
+            'undistort': self._undistort,
+            'detect': self._detect,
+            'pose': self._pose,
+            'render': self._render,
+        }
+        self._threads = [threading.Thread(target=self._capture_loop, name='pipeline-capture', daemon=True)]
+        for stage, next_stage in zip(self.STAGES, self.STAGES[1:] + (None,)):
+            output = self._deliver if next_stage is None else self.queues[next_stage]
+            self._threads.append(threading.Thread(target=self._stage_loop, args=(stage_functions[stage], self.queues[stage], output),
+                                                  name=f'pipeline-{stage}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    # 各階段處理函式
+
+    def _undistort(self, item: DetectionResult) -> Optional[DetectionResult]:
+        item.gray = self.detector.undistort(self.detector.luma(item.source))
+        # 每張影像都會繪製；一併修正（或複製）彩色影像，之後不再讀取擷取緩衝區
+        self.detector.color_frame(item)
+        item.source = None
+        if not self.camera_looper.frame_intact(item.frame_seq):
+            # 在佇列中等待時已被擷取端覆寫
+            self._pending_shed_frames += item.shed_frames
+            return None
+        item.shed_frames += self._pending_shed_frames
+        self._pending_shed_frames = 0
+        return item
+
+    def _detect(self, item: DetectionResult) -> DetectionResult:
+        item.corners, item.ids = self.detector.detect_markers(item.gray)
+        return item
+
+    def _pose(self, item: DetectionResult) -> DetectionResult:
+        result = self.detector.estimate(item.corners, item.ids)
+        # 偵測結果緩衝區會被下一張影像覆寫，傳給下游前先複製
+        item.ids = result.ids
+        item.detections = result.detections.copy()
+        return item
+
+    def _render(self, item: DetectionResult) -> DetectionResult:
+        item.frame = self.detector.draw(item, **self.render_options)
+        return item
+
+    # 執行緒
+
+    def _put(self, output: queue.Queue, item: DetectionResult) -> None:
+        while self.is_running:
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _capture_loop(self) -> None:
+        last_frame_seq = 0
+        shed_frames = 0
+        while self.is_running:
+            ret, frame, frame_seq = self.camera_looper.wait_for_frame(last_frame_seq, timeout=0.1)
+            if frame_seq == last_frame_seq:
+                continue
+            last_frame_seq = frame_seq
+            if not ret:
+                continue
+            if self.load_shedder is not None and not self.load_shedder.should_process():
+                shed_frames += 1
+                continue
+            item = DetectionResult(frame=None, source=frame, corners=(), ids=None, detections=None,
+                                   frame_seq=frame_seq, timestamp=self.camera_looper.frame_timestamp(frame_seq), shed_frames=shed_frames)
+            shed_frames = 0
+            self._put(self.queues['undistort'], item)
+
+    def _stage_loop(self, func: Callable[[DetectionResult], Optional[DetectionResult]], input_queue: queue.Queue, output) -> None:
+        while self.is_running:
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            item = func(item)
+            if item is None:
+                continue
+            if callable(output):
+                output(item)
+            else:
+                self._put(output, item)
+
+    def _deliver(self, item: DetectionResult) -> None:
+        if self.delivery == 'in_order':
+            self._put(self._output, item)
+            return
+        with self._latest_condition:
+            if self._latest is not None:
+                count(self.detector.metrics, 'dropped_results')
+            self._latest = item
+            self._latest_condition.notify_all()
+
+    # 對外介面
+
+    def get_result(self, timeout: float = None) -> Optional[DetectionResult]:
+        """ Returns the next result according to the delivery mode, or None on timeout. """
+        if self.delivery == 'in_order':
+            try:
+                return self._output.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        with self._latest_condition:
+            self._latest_condition.wait_for(lambda: self._latest is not None or not self.is_running, timeout)
+            item, self._latest = self._latest, None
+            return item
+
+    def queue_depths(self) -> Dict[str, int]:
+        """ Current number of frames waiting in front of each stage (and for the consumer). """
+        depths = {stage: q.qsize() for stage, q in self.queues.items()}
+        depths['output'] = self._output.qsize() if self.delivery == 'in_order' else int(self._latest is not None)
+        return depths
+
+    def stop(self) -> None:
+        self.is_running = False
+        with self._latest_condition:
+            self._latest_condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._owns_camera_looper:
+            self.camera_looper.stop()
+        print('Pipeline stopped')
@@ -0,0 +1,170 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from metrics import PerformanceMetrics, count
+
+
+def euler_from_quaternion(x, y, z, w):
+    """
+    Convert a quaternion into euler angles (roll, pitch, yaw)
+    roll is rotation around x in radians (counterclockwise)
+    pitch is rotation around y in radians (counterclockwise)
+    yaw is rotation around z in radians (counterclockwise)
+    Accepts scalars or NumPy arrays of quaternion components.
+    """
+    t0 = +2.0 * (w * x + y * z)
+    t1 = +1.0 - 2.0 * (x * x + y * y)
+    roll_x = np.arctan2(t0, t1)
+
+    t2 = +2.0 * (w * y - z * x)
+    t2 = np.clip(t2, -1.0, +1.0)
+    pitch_y = np.arcsin(t2)
+
+    t3 = +2.0 * (w * z + x * y)
+    t4 = +1.0 - 2.0 * (y * y + z * z)
+    yaw_z = np.arctan2(t3, t4)
+
+    return roll_x, pitch_y, yaw_z  # in radians
+
+
+def offset_degrees(offset_cm: np.ndarray, distance_cm: np.ndarray) -> np.ndarray:
+    # asin(offset / distance)，超出定義域時視為 0 度
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = offset_cm / distance_cm
+        return np.where(np.abs(ratio) <= 1, np.degrees(np.arcsin(np.clip(ratio, -1, 1))), 0.0)
+
+
+@dataclass
+class MarkerPoses:
+    # 每個欄位皆為長度 n 的陣列，順序與輸入的 corners 相同
+    rvecs: np.ndarray  # (n, 3)
+    tvecs: np.ndarray  # (n, 3)
+    yaw: np.ndarray  # degrees
+    pitch: np.ndarray  # degrees
+    roll: np.ndarray  # degrees
+    x_offset_cm: np.ndarray
+    y_offset_cm: np.ndarray
+    distance_cm: np.ndarray
+    x_degree: np.ndarray
+    y_degree: np.ndarray
+
+    def __len__(self):
+        return len(self.rvecs)
+
+
+def angles_from_rvecs(rvecs: np.ndarray):
+    """ Returns (yaw, pitch, roll) in degrees for an (n, 3) array of rotation vectors. """
+    quats = R.from_rotvec(rvecs).as_quat()  # (x, y, z, w)
+    # 沿用原本的軸向定義：將四元數的 x、z 對調後再轉為歐拉角
+    roll_x, yaw_y, pitch_z = euler_from_quaternion(quats[:, 2], quats[:, 1], quats[:, 0], quats[:, 3])
+    return np.degrees(yaw_y), np.degrees(pitch_z), np.degrees(roll_x)
+
+
+def poses_from_vectors(rvecs: np.ndarray, tvecs: np.ndarray) -> MarkerPoses:
+    rvecs = np.asarray(rvecs, np.float64).reshape(-1, 3)
+    tvecs = np.asarray(tvecs, np.float64).reshape(-1, 3)
+    if len(rvecs) == 0:
+        empty = np.zeros(0)
+        return MarkerPoses(rvecs, tvecs, empty, empty, empty, empty, empty, empty, empty, empty)
+
+    yaw, pitch, roll = angles_from_rvecs(rvecs)
+    x_offset_cm = tvecs[:, 0] / 10
+    y_offset_cm = tvecs[:, 1] / 10
+    distance_cm = tvecs[:, 2] / 10
+
+    return MarkerPoses(
+        rvecs=rvecs,
+        tvecs=tvecs,
+        yaw=yaw,
+        pitch=pitch,
+        roll=roll,
+        x_offset_cm=x_offset_cm,
+        y_offset_cm=y_offset_cm,
+        distance_cm=distance_cm,
+        x_degree=offset_degrees(x_offset_cm, distance_cm),
+        y_degree=offset_degrees(y_offset_cm, distance_cm),
+    )
+
+
+def estimate_poses(corners: Sequence[np.ndarray], marker_length_mm: float, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray) -> MarkerPoses:
+    """ Estimates the poses of all detected markers with a single estimatePoseSingleMarkers call. """
+    if len(corners) == 0:
+        return poses_from_vectors(np.zeros((0, 3)), np.zeros((0, 3)))
+    rvecs, tvecs, _ = aruco.estimatePoseSingleMarkers(corners, marker_length_mm, camera_matrix, distortion_coefficients)
+    return poses_from_vectors(rvecs, tvecs)
+
+
+def marker_object_points(marker_length_mm: float) -> np.ndarray:
+    # 與 estimatePoseSingleMarkers 相同的角點座標（左上、右上、右下、左下），亦為 SOLVEPNP_IPPE_SQUARE 要求的順序
+    half = marker_length_mm / 2
+    return np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], np.float64)
+
+
+def valid_pose(ret: bool, rvec: np.ndarray, tvec: np.ndarray) -> bool:
+    """ True if solvePnP succeeded with a finite pose in front of the camera. """
+    return bool(ret) and bool(np.isfinite(rvec).all()) and bool(np.isfinite(tvec).all()) and bool(tvec.reshape(3)[2] > 0)
+
+
+class PoseTracker:
+    """
+    Pose estimation with per-marker-ID state kept across frames.
+    Markers seen for the first time (or again after `timeout` seconds) are solved with SOLVEPNP_IPPE_SQUARE;
+    markers still tracked are refined with SOLVEPNP_ITERATIVE starting from their previous rvec/tvec (useExtrinsicGuess),
+    which is cheaper and keeps the pose from flipping between the two planar solutions from frame to frame.
+    """
+
+    def __init__(self, timeout: float = 0.5, metrics: PerformanceMetrics = None):
+        self.timeout = timeout
+        self.metrics = metrics  # 完整求解與暖啟動細化次數
+        self._states: Dict[int, Tuple[np.ndarray, np.ndarray, float]] = {}  # id -> (rvec, tvec, last seen)
+        self._key = None
+
+    def reset(self) -> None:
+        self._states.clear()
+
+    def estimate(self, ids: np.ndarray, corners: Sequence[np.ndarray], marker_length_mm: float,
+                 camera_matrix: np.ndarray, distortion_coefficients: np.ndarray, now: float = None) -> MarkerPoses:
+        now = time.monotonic() if now is None else now
+        # 標記尺寸或相機參數改變時，先前的姿態已不適用
+        key = (marker_length_mm, camera_matrix.tobytes(), distortion_coefficients.tobytes())
+        if key != self._key:
+            self._states.clear()
+            self._key = key
+        # 清除逾時未出現的標記
+        for marker_id in [marker_id for marker_id, (_, _, last_seen) in self._states.items() if now - last_seen > self.timeout]:
+            del self._states[marker_id]
+
+        object_points = marker_object_points(marker_length_mm)
+        rvecs = np.zeros((len(ids), 3))
+        tvecs = np.zeros((len(ids), 3))
+        for i, (marker_id, marker_corners) in enumerate(zip(np.asarray(ids).flatten().tolist(), corners)):
+            image_points = np.asarray(marker_corners, np.float64).reshape(4, 2)
+            state = self._states.get(marker_id)
+            ret = False
+            if state is not None:
+                rvec, tvec = state[0].copy(), state[1].copy()
+                ret, rvec, tvec = cv2.solvePnP(object_points, image_points, camera_matrix, distortion_coefficients, rvec, tvec,
+                                               useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+                ret = valid_pose(ret, rvec, tvec)
+                count(self.metrics, 'pose_refines', int(ret))
+            if not ret:
+                ret, rvec, tvec = cv2.solvePnP(object_points, image_points, camera_matrix, distortion_coefficients, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+                ret = valid_pose(ret, rvec, tvec)
+                count(self.metrics, 'pose_solves')
+            if not ret:
+                # 無法求解時改用 estimatePoseSingleMarkers，且不保留此標記的狀態
+                self._states.pop(marker_id, None)
+                rvec, tvec, _ = aruco.estimatePoseSingleMarkers([marker_corners], marker_length_mm, camera_matrix, distortion_coefficients)
+                rvecs[i] = rvec.flatten()
+                tvecs[i] = tvec.flatten()
+                continue
+            rvecs[i] = rvec.flatten()
+            tvecs[i] = tvec.flatten()
+            self._states[marker_id] = (rvecs[i].reshape(3, 1), tvecs[i].reshape(3, 1), now)
+        return poses_from_vectors(rvecs, tvecs)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os.path
+import time
+from typing import Tuple
+
+import numpy as np
+
+# 錄影資料夾內容：原始影像（依序排列、無壓縮）、擷取時間（float64，無標頭）與影像格式
+FRAMES_FILE = 'frames.raw'
+TIMESTAMPS_FILE = 'timestamps.raw'
+META_FILE = 'meta.json'
+
+
+class FrameRecorder:
+    """
+    Appends raw frames to `<path>/frames.raw` and their capture timestamps to `<path>/timestamps.raw`,
+    so that the recording can be memory-mapped and replayed by ReplayCamera.
+    The frame format is written to `<path>/meta.json` with the first frame and both files are flushed after every frame,
+    so a recording interrupted by a crash can still be loaded (up to the last complete frame).
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.shape: Tuple[int, ...] = None
+        self.dtype: np.dtype = None
+        self.frame_count = 0
+        self._file = open(os.path.join(path, FRAMES_FILE), 'wb')
+        self._timestamps_file = open(os.path.join(path, TIMESTAMPS_FILE), 'wb')
+
+    def _write_meta(self) -> None:
+        with open(os.path.join(self.path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'shape': list(self.shape or ()),
+                'dtype': np.dtype(self.dtype or np.uint8).str,
+            }, f, indent=2)
+
+    def write(self, frame: np.ndarray, timestamp: float) -> None:
+        if self.shape is None:
+            self.shape, self.dtype = frame.shape, frame.dtype
+            self._write_meta()
+        elif frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError(f'Frame {frame.shape} {frame.dtype} does not match the recording {self.shape} {self.dtype}')
+        self._file.write(memoryview(np.ascontiguousarray(frame)))
+        self._file.flush()
+        # 影像寫入後才寫入擷取時間，兩者中較短者即為完整的影像數
+        self._timestamps_file.write(np.float64(timestamp).tobytes())
+        self._timestamps_file.flush()
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        self._timestamps_file.close()
+        if self.shape is None:
+            self._write_meta()
+        print(f'{self.frame_count} frames recorded to {self.path}')
+
+
+def load_recording(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns (frames, timestamps); frames is a read-only memmap of shape (frame_count, *frame_shape). """
+    with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    dtype = np.dtype(meta['dtype'])
+    timestamps = np.fromfile(os.path.join(path, TIMESTAMPS_FILE), np.float64)
+    frame_size = int(np.prod(meta['shape'])) * dtype.itemsize if meta['shape'] else 0
+    # 中斷的錄影：只保留影像與擷取時間都已完整寫入的部分
+    frame_count = min(os.path.getsize(os.path.join(path, FRAMES_FILE)) // frame_size, len(timestamps)) if frame_size else 0
+    timestamps = timestamps[:frame_count]
+    if frame_count == 0:
+        return np.zeros((0, *meta['shape']), dtype), timestamps
+    frames = np.memmap(os.path.join(path, FRAMES_FILE), dtype=dtype, mode='r', shape=(frame_count, *meta['shape']))
+    return frames, timestamps
+
+
+class ReplayCamera:
+    """
+    Drop-in replacement for utils.Camera that serves a recording made with FrameRecorder.
+    realtime=True reproduces the original frame intervals, realtime=False serves frames as fast as they are read.
+    """
+    finite = True  # 影像數量有限，CameraLooper 應逐張傳遞而非丟棄影像
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.frames, self.timestamps = load_recording(path)
+        self.index = 0
+        self.finished = False
+        self._start_time = None
+        print(f'Replaying {len(self.frames)} frames from {path} ({"original timing" if realtime else "as fast as possible"})')
+
+    def grab(self) -> bool:
+        """ Waits until the next frame is due (realtime) and selects it. """
+        if self.index >= len(self.frames):
+            if not self.loop or len(self.frames) == 0:
+                # 在最後一張影像交出之後才標記結束，讓使用端可先取得所有影像
+                self.finished = True
+                return False
+            self.index = 0
+            self._start_time = None
+
+        if self.realtime:
+            if self._start_time is None:
+                self._start_time = time.perf_counter() - (self.timestamps[self.index] - self.timestamps[0])
+            delay = self._start_time + (self.timestamps[self.index] - self.timestamps[0]) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.index += 1
+        return True
+
+    def retrieve(self, image: np.ndarray = None) -> Tuple[bool, np.ndarray]:
+        """ Copies the grabbed frame, into `image` when its shape and dtype match. """
+        frame = self.frames[self.index - 1]
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, np.array(frame)
+
+    def read(self, image: np.ndarray = None) -> Tuple[bool, np.ndarray]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def connect(self) -> None:
+        pass
+
+    def reconnect(self) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+def main():
+    from utils import CameraLooper
+
+    parser = argparse.ArgumentParser(description='Record camera frames and their capture timestamps for replay (detect.py --replay).')
+    parser.add_argument('path', help='Recording directory.')
+    parser.add_argument('--frames', type=int, help='Stop after this many frames.')
+    parser.add_argument('--seconds', type=float, help='Stop after this many seconds.')
+    args = parser.parse_args()
+
+    recorder = FrameRecorder(args.path)
+    # keep_n：寫入檔案稍慢時依序補上
+    camera_looper = CameraLooper(drop_policy='keep_n')
+    start_time = time.time()
+    last_frame_seq = 0
+    try:
+        while (args.frames is None or recorder.frame_count < args.frames) and (args.seconds is None or time.time() - start_time < args.seconds):
+            ret, frame, frame_seq = camera_looper.wait_for_frame(last_frame_seq, timeout=1)
+            if frame_seq == last_frame_seq:
+                continue
+            last_frame_seq = frame_seq
+            if not ret:
+                continue
+            # 先複製再寫入檔案，複製完成前已被覆寫的影像捨棄
+            timestamp = camera_looper.frame_timestamp(frame_seq)
+            frame = frame.copy()
+            if not camera_looper.frame_intact(frame_seq):
+                continue
+            recorder.write(frame, timestamp)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        camera_looper.stop()
+        recorder.close()
+        print(f'Dropped {camera_looper.dropped_frame_count} frames')
+
+
+if __name__ == '__main__':
+    main()
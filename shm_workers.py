@@ -0,0 +1,193 @@
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from metrics import PerformanceMetrics
+from utils import CameraLooper, FrameRingBuffer
+
+# (shared memory name, capacity, frame shape, dtype str)
+RingDescriptor = Tuple[str, int, Tuple[int, ...], str]
+
+
+class SharedFrameRingBuffer(FrameRingBuffer):
+    """
+    FrameRingBuffer whose frames and sequence numbers live in a multiprocessing.shared_memory block,
+    so that other processes can read frames by index without pickling them.
+    Layout: int64 seqs[capacity] followed by frames[capacity, *shape].
+    """
+
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def _allocate(self, shape: Tuple[int, ...], dtype: np.dtype) -> None:
+        self.close()
+        header_size = self.capacity * np.dtype(np.int64).itemsize
+        frames_size = self.capacity * int(np.prod(shape)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=header_size + frames_size)
+        self.seqs = np.ndarray((self.capacity,), np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((self.capacity, *shape), dtype, buffer=self.shm.buf, offset=header_size)
+
+    @property
+    def descriptor(self) -> Optional[RingDescriptor]:
+        if self.shm is None:
+            return None
+        return self.shm.name, self.capacity, self.frames.shape[1:], self.frames.dtype.str
+
+    def close(self) -> None:
+        if self.shm is None:
+            return
+        # 釋放 numpy 對共享記憶體的參照後才能關閉
+        self.frames = None
+        self.seqs = np.zeros(self.capacity, np.int64)
+        try:
+            self.shm.close()
+        except BufferError:
+            # 仍有影像被外部參照時無法關閉映射，但仍可移除共享記憶體名稱
+            pass
+        self.shm.unlink()
+        self.shm = None
+
+
+# 以下於子行程中執行
+
+_worker_detector = None
+_worker_rings: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray, np.ndarray]] = {}
+
+
+def _init_worker(detector_settings: Dict[str, Any]) -> None:
+    global _worker_detector
+    from marker_detector import MarkerDetector
+    _worker_detector = MarkerDetector.from_settings(detector_settings)
+
+
+def _attach_ring(descriptor: RingDescriptor) -> Tuple[np.ndarray, np.ndarray]:
+    name, capacity, shape, dtype = descriptor
+    if name not in _worker_rings:
+        # 影像尺寸改變時擷取端會建立新的共享記憶體，舊的不再需要
+        for old_name in list(_worker_rings):
+            _worker_rings.pop(old_name)[0].close()
+        shm = shared_memory.SharedMemory(name=name)
+        header_size = capacity * np.dtype(np.int64).itemsize
+        seqs = np.ndarray((capacity,), np.int64, buffer=shm.buf)
+        frames = np.ndarray((capacity, *shape), np.dtype(dtype), buffer=shm.buf, offset=header_size)
+        _worker_rings[name] = (shm, seqs, frames)
+    _, seqs, frames = _worker_rings[name]
+    return seqs, frames
+
+
+def _process_shared_frame(descriptor: RingDescriptor, frame_seq: int) -> Optional[np.ndarray]:
+    """ Detects markers in the shared frame `frame_seq`. Returns None if the frame was overwritten meanwhile. """
+    seqs, frames = _attach_ring(descriptor)
+    index = frame_seq % len(seqs)
+    if seqs[index] != frame_seq:
+        return None
+    result = _worker_detector.process(frames[index])
+    if seqs[index] != frame_seq:
+        return None
+    return result.detections.copy()
+
+
+class SharedMemoryDetectorPool:
+    """
+    Multi-process detection: CameraLooper captures into a SharedFrameRingBuffer,
+    a pool of detector processes reads the frames by index and returns compact DETECTION_DTYPE records,
+    and the results are handed out re-ordered by frame sequence number.
+    """
+
+    def __init__(self, detector_settings: Dict[str, Any], workers: int = None, ring_size: int = None, metrics: PerformanceMetrics = None, camera=None):
+        self.workers = workers or os.cpu_count()
+        self.is_running = True
+        self.dropped_frame_count = 0
+
+        ring = SharedFrameRingBuffer(ring_size or self.workers * 4 + 4)
+        # 同時處理中的影像數須小於環形緩衝區大小，避免影像在處理完成前被覆寫
+        self.max_in_flight = max(min(self.workers * 2, ring.capacity - 4), 1)
+        # 總是派送最新影像，讓每張影像在被覆寫前有最多的處理時間
+        # 重播時則逐張派送，擷取端等待處理中的影像完成而不覆寫
+        drop_policy = 'block' if camera is not None and camera.finite else 'latest'
+        self.camera_looper = CameraLooper(drop_policy=drop_policy, ring=ring, metrics=metrics, camera=camera, block_margin=self.max_in_flight)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(detector_settings,))
+
+        self._dispatched_seq = 0
+        self._lock = threading.Condition()
+        self._in_flight: deque = deque()  # 依送出順序排列的 frame_seq
+        self._timestamps: Dict[int, float] = {}
+        self._finished: Dict[int, Optional[np.ndarray]] = {}
+        self._output: queue.Queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='shm-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch_loop(self) -> None:
+        last_frame_seq = 0
+        while self.is_running:
+            with self._lock:
+                self._lock.wait_for(lambda: len(self._in_flight) < self.max_in_flight or not self.is_running)
+            ret, frame, frame_seq = self.camera_looper.wait_for_frame(last_frame_seq, timeout=0.1)
+            if frame_seq == last_frame_seq or not self.is_running:
+                continue
+            if last_frame_seq:
+                self.dropped_frame_count += frame_seq - last_frame_seq - 1
+            last_frame_seq = frame_seq
+            if not ret:
+                self._dispatched_seq = frame_seq
+                continue
+            descriptor = self.camera_looper.ring.descriptor
+            with self._lock:
+                self._in_flight.append(frame_seq)
+                self._timestamps[frame_seq] = self.camera_looper.frame_timestamp(frame_seq)
+            future = self.executor.submit(_process_shared_frame, descriptor, frame_seq)
+            future.add_done_callback(lambda f, seq=frame_seq: self._on_done(seq, f))
+            self._dispatched_seq = frame_seq
+
+    def _on_done(self, frame_seq: int, future: Future) -> None:
+        detections = None
+        if not future.cancelled():
+            try:
+                detections = future.result()
+            except Exception as e:
+                print(f'Frame {frame_seq} failed: {e}')
+        with self._lock:
+            self._finished[frame_seq] = detections
+            # 依 frame_seq 順序釋出已完成的結果
+            while self._in_flight and self._in_flight[0] in self._finished:
+                seq = self._in_flight.popleft()
+                result = self._finished.pop(seq)
+                timestamp = self._timestamps.pop(seq)
+                if result is None:
+                    self.dropped_frame_count += 1
+                else:
+                    self._output.put((seq, timestamp, result))
+            self._lock.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        """ True once a finite source (replay) is exhausted and every result has been handed out. """
+        with self._lock:
+            return (self.camera_looper.finished and self._dispatched_seq == self.camera_looper.frame_seq
+                    and not self._in_flight and self._output.empty())
+
+    def get_result(self, timeout: float = None) -> Optional[Tuple[int, float, np.ndarray]]:
+        """ Returns (frame_seq, timestamp, detections) in frame order, or None on timeout. """
+        try:
+            return self._output.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self) -> None:
+        self.is_running = False
+        with self._lock:
+            self._lock.notify_all()
+        self._dispatcher.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.camera_looper.stop()
+        self.camera_looper.ring.close()
+        print('SharedMemoryDetectorPool stopped')
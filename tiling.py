@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from metrics import PerformanceMetrics, count
+from tracking import DetectFunction, offset_corners
+
+
+def tile_ranges(length: int, count: int, overlap: int) -> List[Tuple[int, int]]:
+    """ Splits [0, length) into `count` ranges; consecutive ranges share `overlap` pixels. """
+    edges = np.linspace(0, length, count + 1).round().astype(int)
+    half = (overlap + 1) // 2
+    return [(max(edges[i] - half, 0), min(edges[i + 1] + half, length)) for i in range(count)]
+
+
+def marker_pixel_size(marker_length_mm: float, camera_matrix: np.ndarray, min_distance_mm: float) -> float:
+    """ Side length (px) of a fronto-parallel marker at `min_distance_mm` from the camera. """
+    return max(camera_matrix[0, 0], camera_matrix[1, 1]) * marker_length_mm / min_distance_mm
+
+
+class TiledDetector:
+    """
+    Splits large frames into a grid of overlapping tiles and detects markers on the tiles in parallel threads
+    (aruco.detectMarkers releases the GIL).
+    Consecutive tiles overlap by `overlap_factor` times the largest expected marker size, so every marker up to
+    `max_marker_px` (given to `detect`) lies entirely inside at least one tile.
+    Markers found in several tiles are merged by ID and corner distance.
+    """
+
+    def __init__(self, workers: Optional[int] = None, overlap_factor: float = 1.5, min_tile_px: int = 320, metrics: PerformanceMetrics = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.overlap_factor = overlap_factor
+        self.min_tile_px = min_tile_px  # 區塊（不含重疊）的最小邊長，過小的影像不切割
+        self.metrics = metrics  # 分塊與未分塊的偵測次數
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def grid(self, width: int, height: int, max_marker_px: float) -> Tuple[int, int, int]:
+        """ Returns (columns, rows, overlap): about `workers` tiles, each larger than the overlap. """
+        overlap = int(np.ceil(max_marker_px * self.overlap_factor))
+        min_tile = max(self.min_tile_px, overlap)
+        candidates = [(1, 1)]
+        for rows in range(1, self.workers + 1):
+            columns = self.workers // rows
+            if width / columns >= min_tile and height / rows >= min_tile:
+                candidates.append((columns, rows))
+        # 區塊數最多者優先；數量相同時選擇較接近正方形的區塊（重疊面積較小）
+        best = max(candidates, key=lambda grid: (grid[0] * grid[1], -abs(np.log(width / grid[0] / (height / grid[1])))))
+        return best[0], best[1], overlap
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tile')
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @staticmethod
+    def merge(corners: List[np.ndarray], ids: List[int], max_distance: float) -> Tuple[List[np.ndarray], List[int]]:
+        """ Drops markers with the same ID whose corners are on average within `max_distance` of an already kept one. """
+        kept_corners = []
+        kept_ids = []
+        for marker_corners, marker_id in zip(corners, ids):
+            duplicate = any(
+                kept_id == marker_id and np.linalg.norm(kept.reshape(4, 2) - marker_corners.reshape(4, 2), axis=1).mean() < max_distance
+                for kept, kept_id in zip(kept_corners, kept_ids))
+            if not duplicate:
+                kept_corners.append(marker_corners)
+                kept_ids.append(marker_id)
+        return kept_corners, kept_ids
+
+    def detect(self, image: np.ndarray, detect_fn: DetectFunction, max_marker_px: float):
+        height, width = image.shape[:2]
+        columns, rows, overlap = self.grid(width, height, max_marker_px)
+        if columns * rows == 1:
+            count(self.metrics, 'single_tile_scans')
+            return detect_fn(image)
+
+        # 裁切為 view，不複製影像
+        tiles = [(x0, y0, image[y0:y1, x0:x1])
+                 for y0, y1 in tile_ranges(height, rows, overlap)
+                 for x0, x1 in tile_ranges(width, columns, overlap)]
+        results = self._get_executor().map(lambda tile: detect_fn(tile[2]), tiles)
+        found_corners = []
+        found_ids = []
+        for (x0, y0, _), (tile_corners, tile_ids) in zip(tiles, results):
+            if tile_ids is None:
+                continue
+            found_corners.extend(offset_corners(tile_corners, x0, y0))
+            found_ids.extend(int(marker_id) for marker_id in tile_ids.flatten())
+        count(self.metrics, 'tiled_scans')
+        if not found_ids:
+            return (), None
+
+        # 同一標記在重疊區會被偵測多次；以角點距離區分同 ID 的不同標記
+        sides = [np.linalg.norm(c.reshape(4, 2) - np.roll(c.reshape(4, 2), 1, axis=0), axis=1).min() for c in found_corners]
+        corners, ids = self.merge(found_corners, found_ids, max_distance=max(min(sides) / 4, 2.0))
+        return tuple(corners), np.array(ids, np.int32).reshape(-1, 1)
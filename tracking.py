@@ -0,0 +1,170 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from metrics import PerformanceMetrics, count
+
+# detect_fn(image) -> (corners, ids)，與 aruco.detectMarkers 回傳格式相同
+DetectFunction = Callable[[np.ndarray], Tuple[Tuple[np.ndarray, ...], Optional[np.ndarray]]]
+
+
+def offset_corners(corners, dx: float, dy: float) -> List[np.ndarray]:
+    # 將裁切影像中的角點座標轉回完整影像座標
+    offset = np.array([dx, dy], np.float32)
+    return [c + offset for c in corners]
+
+
+def merge_boxes(boxes: List[np.ndarray]) -> List[np.ndarray]:
+    """ Merges overlapping (x0, y0, x1, y1) boxes until none overlap, so each marker is searched only once. """
+    boxes = [box.copy() for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = np.array([min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])])
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+class RoiTracker:
+    """
+    Restricts marker detection to padded crops around the markers found in the previous frame.
+    A full-frame scan runs every `rescan_interval` frames, when nothing is tracked,
+    or as soon as a tracked marker is not found in its crop.
+    """
+
+    def __init__(self, rescan_interval: int = 30, padding: float = 0.5, min_padding_px: int = 16, metrics: PerformanceMetrics = None):
+        self.rescan_interval = rescan_interval
+        self.padding = padding
+        self.min_padding_px = min_padding_px
+        self.metrics = metrics  # 完整掃描與 ROI 掃描次數
+        self.boxes: Dict[int, np.ndarray] = {}  # id -> (x0, y0, x1, y1)
+        self.frames_since_rescan = 0
+
+    def reset(self) -> None:
+        self.boxes.clear()
+        self.frames_since_rescan = 0
+
+    def _padded_box(self, box: np.ndarray, width: int, height: int) -> np.ndarray:
+        size = max(box[2] - box[0], box[3] - box[1])
+        pad = max(size * self.padding, self.min_padding_px)
+        return np.array([
+            max(int(box[0] - pad), 0),
+            max(int(box[1] - pad), 0),
+            min(int(np.ceil(box[2] + pad)), width),
+            min(int(np.ceil(box[3] + pad)), height),
+        ])
+
+    def _update_boxes(self, corners, ids: Optional[np.ndarray]) -> None:
+        self.boxes.clear()
+        if ids is None:
+            return
+        for marker_corners, marker_id in zip(corners, ids.flatten()):
+            points = marker_corners.reshape(4, 2)
+            self.boxes[int(marker_id)] = np.concatenate([points.min(axis=0), points.max(axis=0)])
+
+    def _full_scan(self, frame: np.ndarray, detect_fn: DetectFunction):
+        corners, ids = detect_fn(frame)
+        self._update_boxes(corners, ids)
+        self.frames_since_rescan = 0
+        count(self.metrics, 'roi_full_scans')
+        return corners, ids
+
+    def detect(self, frame: np.ndarray, detect_fn: DetectFunction):
+        if not self.boxes or self.frames_since_rescan >= self.rescan_interval:
+            return self._full_scan(frame, detect_fn)
+
+        height, width = frame.shape[:2]
+        rois = merge_boxes([self._padded_box(box, width, height) for box in self.boxes.values()])
+        found_corners = []
+        found_ids = []
+        for x0, y0, x1, y1 in rois:
+            roi_corners, roi_ids = detect_fn(frame[y0:y1, x0:x1])
+            if roi_ids is None:
+                continue
+            for marker_corners, marker_id in zip(offset_corners(roi_corners, x0, y0), roi_ids.flatten()):
+                if marker_id not in found_ids:
+                    found_corners.append(marker_corners)
+                    found_ids.append(marker_id)
+
+        # 有追蹤中的標記遺失時，立即重新掃描完整影像
+        if not set(self.boxes).issubset(int(marker_id) for marker_id in found_ids):
+            return self._full_scan(frame, detect_fn)
+
+        self.frames_since_rescan += 1
+        count(self.metrics, 'roi_scans')
+        ids = np.array(found_ids, np.int32).reshape(-1, 1)
+        self._update_boxes(found_corners, ids)
+        return tuple(found_corners), ids
+
+
+class FlowTracker:
+    """
+    Propagates the corners of the previously detected markers to the next frame with pyramidal Lucas-Kanade optical flow,
+    so detection only runs every `redetect_interval` frames.
+    Detection also runs when nothing is tracked, or as soon as a corner is lost or its forward-backward
+    flow error exceeds `max_error` pixels. Marker IDs are carried over from the last detection.
+    """
+
+    def __init__(self, redetect_interval: int = 10, max_error: float = 1.0, win_size: int = 21, max_level: int = 2,
+                 metrics: PerformanceMetrics = None):
+        self.redetect_interval = redetect_interval
+        self.max_error = max_error
+        self.win_size = (win_size, win_size)
+        self.max_level = max_level
+        self.criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        self.metrics = metrics  # 偵測與光流追蹤次數
+        self.prev_gray: Optional[np.ndarray] = None
+        self.corners: Optional[np.ndarray] = None  # (N, 4, 2)
+        self.ids: Optional[np.ndarray] = None  # (N, 1)
+        self.frames_since_detect = 0
+
+    def reset(self) -> None:
+        self.prev_gray = None
+        self.corners = None
+        self.ids = None
+        self.frames_since_detect = 0
+
+    def _detect(self, frame: np.ndarray, gray: np.ndarray, detect_fn: DetectFunction):
+        corners, ids = detect_fn(frame)
+        self.prev_gray = gray
+        self.frames_since_detect = 0
+        count(self.metrics, 'flow_detections')
+        if ids is None or len(corners) == 0:
+            self.corners = None
+            self.ids = None
+        else:
+            self.corners = np.asarray(corners, np.float32).reshape(-1, 4, 2)
+            self.ids = np.asarray(ids, np.int32).reshape(-1, 1)
+        return corners, ids
+
+    def _flow(self, prev_gray: np.ndarray, gray: np.ndarray, points: np.ndarray):
+        return cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, winSize=self.win_size, maxLevel=self.max_level, criteria=self.criteria)
+
+    def detect(self, frame: np.ndarray, detect_fn: DetectFunction):
+        # 保留前一張灰階影像供下一次追蹤，灰階輸入須複製（可能是會被覆寫的緩衝區）
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame.copy()
+        if self.corners is None or self.frames_since_detect >= self.redetect_interval or self.prev_gray.shape != gray.shape:
+            return self._detect(frame, gray, detect_fn)
+
+        points = self.corners.reshape(-1, 1, 2)
+        next_points, status, _ = self._flow(self.prev_gray, gray, points)
+        # 反向追蹤回前一張影像，以來回誤差判斷追蹤是否可靠
+        back_points, back_status, _ = self._flow(gray, self.prev_gray, next_points)
+        error = np.linalg.norm(back_points - points, axis=2)
+        if not status.all() or not back_status.all() or error.max() > self.max_error:
+            return self._detect(frame, gray, detect_fn)
+
+        self.prev_gray = gray
+        self.corners = next_points.reshape(-1, 4, 2)
+        self.frames_since_detect += 1
+        count(self.metrics, 'flow_tracks')
+        return tuple(c.reshape(1, 4, 2) for c in self.corners), self.ids.copy()
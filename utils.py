@@ -8,7 +8,8 @@ from typing import Tuple
 import cv2
 import numpy as np
 
-from config import VIDEO_CAPTURE_SOURCE
+from config import CAPTURE_PROFILE, VIDEO_CAPTURE_SOURCE
+from metrics import PerformanceMetrics, count, timed
 
 
 class Singleton(type):
@@ -34,30 +35,120 @@ def synchronized(wrapped):
     return _wrap
 
 
+def fourcc_to_str(fourcc: float) -> str:
+    code = int(fourcc)
+    return ''.join(chr((code >> 8 * i) & 0xFF) for i in range(4))
+
+
 class Camera(metaclass=Singleton):
     cv2_camera: cv2.VideoCapture = None
-
-    def __init__(self):
+    finite: bool = False  # 即時影像來源，沒有結束的時候
+    finished: bool = False
+    profile: dict = None
+    live: bool = True  # 影片檔不丟棄佇列中的影像
+    frame_interval: float = 0.0  # 秒
+    instant_grab_seconds: float = 0.001  # 短於此時間完成的 grab，影像早已在佇列中
+    last_grab_end: float = 0.0
+    queued_frames: float = 0.0  # 估計 driver 佇列中等待的影像數
+    metrics: PerformanceMetrics = None  # 丟棄的過時影像數（stale_frames）
+
+    def __init__(self, profile: dict = None):
+        self.profile = dict(CAPTURE_PROFILE if profile is None else profile)
         self.connect()
 
     @synchronized
-    def read(self) -> Tuple[bool, np.ndarray]:
-        ret, frame = self.cv2_camera.read()
-        return ret, frame
+    def grab(self) -> bool:
+        """ Waits for the next frame without decoding it. """
+        # 上一次 grab 結束後，每個影像間隔有一張影像進入佇列；需要等待的 grab 表示佇列已空。
+        # 立即完成的 grab 若佇列中估計還有較新的影像，丟棄這張（過時）並取下一張，最多清空 buffer_size 張
+        buffer_size = self.profile.get('buffer_size') or 4
+        drain = self.live and self.profile.get('drain_stale_frames') and self.frame_interval > 0
+        if drain:
+            self.queued_frames = min(self.queued_frames + (time.perf_counter() - self.last_grab_end) / self.frame_interval, buffer_size)
+        for _ in range(buffer_size + 1 if drain else 1):
+            start = time.perf_counter()
+            if not self.cv2_camera.grab():
+                return False
+            self.last_grab_end = time.perf_counter()
+            if self.last_grab_end - start >= self.instant_grab_seconds:
+                self.queued_frames = 0.0
+                break
+            self.queued_frames = max(self.queued_frames - 1, 0.0)
+            if not drain or self.queued_frames < 1:
+                break
+            count(self.metrics, 'stale_frames')
+        return True
+
+    @synchronized
+    def retrieve(self, image: np.ndarray = None) -> Tuple[bool, np.ndarray]:
+        """ Decodes the grabbed frame. """
+        # 若提供 image，VideoCapture 會盡量直接寫入該緩衝區
+        return self.cv2_camera.retrieve(image)
+
+    def read(self, image: np.ndarray = None) -> Tuple[bool, np.ndarray]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def _apply_profile(self) -> None:
+        profile = self.profile
+        # 部分後端須先設定 FOURCC 才能選擇對應的解析度與 fps
+        if profile.get('fourcc'):
+            self.cv2_camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*profile['fourcc']))
+        for prop, key in ((cv2.CAP_PROP_FRAME_WIDTH, 'width'), (cv2.CAP_PROP_FRAME_HEIGHT, 'height'), (cv2.CAP_PROP_FPS, 'fps'),
+                          (cv2.CAP_PROP_BUFFERSIZE, 'buffer_size'), (cv2.CAP_PROP_AUTO_EXPOSURE, 'auto_exposure'), (cv2.CAP_PROP_EXPOSURE, 'exposure')):
+            if profile.get(key) is not None:
+                self.cv2_camera.set(prop, profile[key])
+
+    def negotiated_settings(self) -> dict:
+        """ Settings actually in effect, as reported by the backend. """
+        return {
+            'backend': self.cv2_camera.getBackendName() if self.cv2_camera.isOpened() else None,
+            'width': self.cv2_camera.get(cv2.CAP_PROP_FRAME_WIDTH),
+            'height': self.cv2_camera.get(cv2.CAP_PROP_FRAME_HEIGHT),
+            'fps': self.cv2_camera.get(cv2.CAP_PROP_FPS),
+            'fourcc': fourcc_to_str(self.cv2_camera.get(cv2.CAP_PROP_FOURCC)),
+            'buffer_size': self.cv2_camera.get(cv2.CAP_PROP_BUFFERSIZE),
+            'auto_exposure': self.cv2_camera.get(cv2.CAP_PROP_AUTO_EXPOSURE),
+            'exposure': self.cv2_camera.get(cv2.CAP_PROP_EXPOSURE),
+        }
+
+    def measure_frame_intervals(self, frame_count: int) -> np.ndarray:
+        """ Grabs `frame_count` frames (without decoding them) and returns the intervals between them in seconds. """
+        times = []
+        for _ in range(frame_count + 1):
+            if not self.cv2_camera.grab():
+                break
+            times.append(time.perf_counter())
+        return np.diff(times)
 
     @synchronized
     def connect(self) -> None:
         print('Camera connecting...')
-        self.cv2_camera = cv2.VideoCapture(VIDEO_CAPTURE_SOURCE)
+        backend = self.profile.get('backend')
+        self.cv2_camera = cv2.VideoCapture(VIDEO_CAPTURE_SOURCE, getattr(cv2, backend) if backend else cv2.CAP_ANY)
         print('VideoCapture created')
-        self.cv2_camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cv2_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cv2_camera.set(cv2.CAP_PROP_FPS, 60)
-        width = self.cv2_camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-        height = self.cv2_camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        fps = self.cv2_camera.get(cv2.CAP_PROP_FPS)
-        print(f'Resolution: {width} * {height}')
-        print(f'FPS: {fps}')
+        self._apply_profile()
+        # 影片檔有影格總數，即時來源則無
+        self.live = self.cv2_camera.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+
+        settings = self.negotiated_settings()
+        for key, value in settings.items():
+            requested = self.profile.get(key)
+            note = f' (requested {requested})' if requested is not None and requested != value and key != 'backend' else ''
+            print(f'{key}: {value}{note}')
+
+        # 量測實際的影像間隔與抖動，供判斷過時影像
+        fps = settings['fps'] or self.profile.get('fps') or 30
+        self.frame_interval = 1 / fps
+        sample_frames = self.profile.get('jitter_sample_frames') or 0
+        if self.live and sample_frames:
+            intervals = self.measure_frame_intervals(sample_frames)
+            if len(intervals):
+                intervals_ms = intervals * 1000
+                print(f'Frame interval: {intervals_ms.mean():.2f} ms ({1000 / intervals_ms.mean():.1f} fps), '
+                      f'jitter {intervals_ms.std():.2f} ms, min {intervals_ms.min():.2f} ms, max {intervals_ms.max():.2f} ms')
+                self.frame_interval = float(np.median(intervals))
 
     @synchronized
     def reconnect(self) -> None:
@@ -71,47 +162,204 @@ class Camera(metaclass=Singleton):
         self.cv2_camera.release()
 
 
+class FrameRingBuffer:
+    """
+    Fixed-size ring of preallocated frames and their capture timestamps.
+    Slots are allocated once for a given frame shape and reused afterwards.
+    A frame returned by `get` is a view of its slot and stays valid only until the ring wraps around to it again;
+    readers check `is_current` after using it.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 2)
+        self.frames: np.ndarray = None
+        self.timestamps = np.zeros(self.capacity, np.float64)
+        self.seqs = np.zeros(self.capacity, np.int64)
+        self.latest_seq = 0
+
+    def ensure_shape(self, shape: Tuple[int, ...], dtype=np.uint8) -> None:
+        if self.frames is None or self.frames.shape[1:] != tuple(shape) or self.frames.dtype != dtype:
+            self._allocate(tuple(shape), np.dtype(dtype))
+            self.seqs[:] = 0
+
+    def _allocate(self, shape: Tuple[int, ...], dtype: np.dtype) -> None:
+        self.frames = np.zeros((self.capacity, *shape), dtype)
+
+    def next_slot(self) -> np.ndarray:
+        """ Returns the slot that the next committed frame will occupy, marking it invalid until `commit`. """
+        if self.frames is None:
+            return None
+        index = (self.latest_seq + 1) % self.capacity
+        self.seqs[index] = 0
+        return self.frames[index]
+
+    def commit(self, frame: np.ndarray, timestamp: float) -> int:
+        self.ensure_shape(frame.shape, frame.dtype)
+        seq = self.latest_seq + 1
+        index = seq % self.capacity
+        if frame is not self.frames[index] and not np.may_share_memory(frame, self.frames[index]):
+            np.copyto(self.frames[index], frame)
+        self.timestamps[index] = timestamp
+        self.seqs[index] = seq
+        self.latest_seq = seq
+        return seq
+
+    def oldest_seq(self) -> int:
+        # 保留一格給正在寫入的下一張影像
+        return max(self.latest_seq - self.capacity + 2, 1)
+
+    def is_current(self, seq: int) -> bool:
+        """ True while the slot of `seq` still holds that frame (not overwritten, nor being written). """
+        return self.frames is not None and self.seqs[seq % self.capacity] == seq
+
+    def get(self, seq: int) -> Tuple[np.ndarray, float]:
+        index = seq % self.capacity
+        if self.frames is None or seq < self.oldest_seq() or self.seqs[index] != seq:
+            return None, 0.0
+        return self.frames[index], float(self.timestamps[index])
+
+
 class CameraLooper(threading.Thread):
+    """
+    Captures frames on a single long-lived thread into a FrameRingBuffer.
+    `camera` defaults to the live Camera; any object with the same grab/retrieve/reconnect/release interface
+    (e.g. recording.ReplayCamera) can be used instead.
+    drop_policy:
+      'latest' - consumers always receive the newest frame, older ones are skipped.
+      'keep_n' - consumers receive frames in order while they are still in the ring (buffer_size frames);
+                 frames overwritten before being read are counted in dropped_frame_count.
+    Frames from `wait_for_frame` are views of ring slots: the capture thread keeps writing (except with 'block'),
+    so consumers call `frame_intact` once they are done with a frame and discard what they derived from it if it was overwritten.
+      'block'  - like 'keep_n', but capturing waits for the consumer instead of overwriting unread frames
+                 (and `block_margin` more slots), so no frame is ever dropped. Meant for finite sources such as replays.
+    """
+    DROP_POLICIES = ('latest', 'keep_n', 'block')
+
     is_running: bool = False
     camera: Camera = None
-    ret: bool = None
-    frame: np.ndarray = None
+    ring: FrameRingBuffer = None
+    drop_policy: str = 'latest'
+    frame_condition: threading.Condition = None
+    dropped_frame_count: int = 0
     recent_frame_count: int = 10
-    recent_frame_time: deque = deque([0.0], maxlen=recent_frame_count)
+    recent_frame_time: deque = None
     fps: float = 0.0
-
-    def __init__(self):
+    metrics: PerformanceMetrics = None
+    consumed_seq: int = 0
+    block_margin: int = 0
+
+    def __init__(self, buffer_size: int = 8, drop_policy: str = 'latest', ring: FrameRingBuffer = None, metrics: PerformanceMetrics = None,
+                 camera=None, block_margin: int = 0):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy: {drop_policy}')
         self.is_running = True
+        self.drop_policy = drop_policy
+        self.ring = FrameRingBuffer(buffer_size) if ring is None else ring
+        self.metrics = metrics
+        self.block_margin = block_margin
+        self.frame_condition = threading.Condition()
+        self.recent_frame_time = deque([0.0], maxlen=self.recent_frame_count)
         threading.Thread.__init__(self)
         self.daemon = True
-        self.camera = Camera()
+        if camera is None:
+            camera = Camera()
+            camera.metrics = metrics
+        self.camera = camera
         self.start()
         print('CameraLooper started')
 
+    @property
+    def frame_seq(self) -> int:
+        return self.ring.latest_seq
+
+    @property
+    def finished(self) -> bool:
+        """ True once a finite source (replay) has no more frames. """
+        return self.camera.finished
+
     def run(self) -> None:
-        if not self.is_running:
-            return
-        self.camera_loop()
-        threading.Timer(0, self.run).start()
+        while self.is_running:
+            self.camera_loop()
 
     def camera_loop(self) -> None:
-        ret, frame = self.camera.read()
-        if not ret and self.is_running:
-            self.camera.reconnect()
+        if self.drop_policy == 'block':
+            # 等待使用端讀取，避免覆寫尚未處理的影像
+            with self.frame_condition:
+                self.frame_condition.wait_for(lambda: self.ring.latest_seq - self.consumed_seq < self.ring.capacity - 1 - self.block_margin or not self.is_running)
+            if not self.is_running:
+                return
+        # 等待下一張影像的時間另計為 grab_wait，capture 只計解碼與寫入 ring 的時間
+        with timed(self.metrics, 'grab_wait'):
+            ret = self.camera.grab()
+        start = time.perf_counter_ns()
+        if ret:
+            ret, frame = self.camera.retrieve(self.ring.next_slot())
+        if not ret:
+            if self.camera.finished:
+                # 重播結束，不再有新影像
+                time.sleep(0.1)
+            elif self.is_running:
+                self.camera.reconnect()
             return
 
         new_frame_time = time.time()
         self.fps = 1 / ((new_frame_time - self.recent_frame_time[0]) / self.recent_frame_count)
         self.recent_frame_time.append(new_frame_time)
 
-        self.ret = ret
-        self.frame = frame
+        with self.frame_condition:
+            self.ring.commit(frame, new_frame_time)
+            self.frame_condition.notify_all()
+        if self.metrics is not None:
+            self.metrics.record('capture', time.perf_counter_ns() - start)
 
     def read(self) -> Tuple[bool, np.ndarray]:
-        return self.ret, self.frame
+        """ A copy of the newest frame. """
+        with self.frame_condition:
+            seq = self.ring.latest_seq
+            frame, _ = self.ring.get(seq)
+            frame = None if frame is None else frame.copy()
+        # 複製期間擷取端可能已開始覆寫同一格
+        if frame is None or not self.ring.is_current(seq):
+            return False, None
+        return True, frame
+
+    def wait_for_frame(self, last_seq: int, timeout: float = None) -> Tuple[bool, np.ndarray, int]:
+        """
+        Wait until a frame newer than `last_seq` is captured, or until `timeout` seconds have passed.
+        Returns (ret, frame, seq). On timeout, seq is still equal to `last_seq`.
+        Which newer frame is returned depends on `drop_policy`.
+        """
+        with self.frame_condition:
+            self.frame_condition.wait_for(lambda: self.ring.latest_seq > last_seq or not self.is_running, timeout)
+            if self.ring.latest_seq <= last_seq:
+                return False, None, last_seq
+            if self.drop_policy == 'latest':
+                seq = self.ring.latest_seq
+            else:
+                seq = max(last_seq + 1, self.ring.oldest_seq())
+                self.dropped_frame_count += seq - last_seq - 1
+            frame, _ = self.ring.get(seq)
+            self.consumed_seq = seq
+            self.frame_condition.notify_all()
+            return frame is not None, frame, seq
+
+    def frame_intact(self, seq: int) -> bool:
+        """ True if frame `seq` has not been overwritten since `wait_for_frame`; otherwise it is counted in dropped_frame_count. """
+        with self.frame_condition:
+            if self.ring.is_current(seq):
+                return True
+            self.dropped_frame_count += 1
+            return False
+
+    def frame_timestamp(self, seq: int) -> float:
+        """ Capture time (time.time()) of the frame with the given sequence number, 0.0 if it has been overwritten. """
+        with self.frame_condition:
+            return self.ring.get(seq)[1]
 
     def stop(self) -> None:
         self.is_running = False
+        with self.frame_condition:
+            self.frame_condition.notify_all()
         self.camera.release()
         self.join()
         print('CameraLooper stopped')
@@ -134,30 +382,131 @@ class Chessboard:
         return objp
 
 
+class Undistorter:
+    """
+    Undistortion engine backed by precomputed remap tables.
+    Maps are built once with initUndistortRectifyMap in fixed-point CV_16SC2 form,
+    rebuilt only when the frame size or the calibration coefficients change,
+    and applied with cv2.remap into a reused output buffer.
+    The same maps serve color frames and single-channel (luma) frames, each with its own output buffers.
+    """
+    camera_matrix: np.ndarray = None
+    distortion_coefficients: np.ndarray = None
+    new_camera_matrix: np.ndarray = None
+    roi: Tuple[int, int, int, int] = None
+
+    def __init__(self, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray, alpha: float = 0, buffer_count: int = 1):
+        self.alpha = alpha
+        self._map_key = None
+        self._map1 = None
+        self._map2 = None
+        # 輸出緩衝區輪流使用，讓下游（例如管線中的其他階段）仍可安全讀取先前的結果
+        self.buffer_count = buffer_count
+        self._outputs = {}  # (shape, dtype) -> [輸出緩衝區, 下一個使用的索引]
+        # 偵測（灰階）與顯示（彩色）可能在不同執行緒同時修正畸變
+        self._lock = threading.Lock()
+        self.set_coefficients(camera_matrix, distortion_coefficients)
+
+    def set_coefficients(self, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray) -> None:
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.distortion_coefficients = np.asarray(distortion_coefficients, dtype=np.float64)
+
+    def _ensure_maps(self, size: Tuple[int, int]) -> None:
+        key = (size, self.alpha, self.camera_matrix.tobytes(), self.distortion_coefficients.tobytes())
+        if key == self._map_key:
+            return
+        self.new_camera_matrix, self.roi = cv2.getOptimalNewCameraMatrix(self.camera_matrix, self.distortion_coefficients, size, self.alpha, size)
+        self._map1, self._map2 = cv2.initUndistortRectifyMap(self.camera_matrix, self.distortion_coefficients, None, self.new_camera_matrix, size, cv2.CV_16SC2)
+        self._map_key = key
+
+    def _next_output(self, frame: np.ndarray) -> np.ndarray:
+        key = (frame.shape, frame.dtype)
+        outputs = self._outputs.get(key)
+        if outputs is None or len(outputs[0]) != self.buffer_count:
+            outputs = self._outputs[key] = [[np.empty_like(frame) for _ in range(self.buffer_count)], 0]
+        buffers, index = outputs
+        outputs[1] = (index + 1) % self.buffer_count
+        return buffers[index]
+
+    def undistort(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Undistort the frame and crop it to the valid ROI.
+        The returned array is a view into an internal buffer that is overwritten `buffer_count` calls later.
+        """
+        h, w = frame.shape[:2]
+        with self._lock:
+            self._ensure_maps((w, h))
+            output = self._next_output(frame)
+            map1, map2, roi = self._map1, self._map2, self.roi
+        cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, dst=output)
+        # 裁剪 ROI
+        x, y, w, h = roi
+        return output[y:y + h, x:x + w]
+
+
+class RenderScheduler:
+    """
+    Decides when GUI widgets should be refreshed.
+    Rendering is rate-limited to `refresh_rate` times per second, independent of the processing rate,
+    and individual widget updates are skipped when their value is unchanged since the last update.
+    """
+    _unset = object()
+
+    def __init__(self, refresh_rate: float = 30):
+        self.refresh_rate = refresh_rate
+        self._last_render_time = 0.0
+        self._last_values = {}
+
+    def should_render(self) -> bool:
+        """ Returns True (and starts a new render interval) if the previous render is older than 1 / refresh_rate. """
+        now = time.perf_counter()
+        if self.refresh_rate and now - self._last_render_time < 1 / self.refresh_rate:
+            return False
+        self._last_render_time = now
+        return True
+
+    def changed(self, key: str, value) -> bool:
+        """ Returns True if `value` differs from the value last seen for `key`, and remembers it. """
+        if self._last_values.get(key, self._unset) == value:
+            return False
+        self._last_values[key] = value
+        return True
+
+    def reset(self) -> None:
+        self._last_values.clear()
+
+
 def embed_img(src_img: np.array, dest_img: np.array, dest_points: list, alpha: float = 1) -> np.array:
-    h, w, _ = dest_img.shape
-    # 座標
-    src_points = np.array([(0, 0), (0, h), (w, h), (w, 0)], dtype=np.float32)
+    """
+    Warps `src_img` onto the quadrilateral `dest_points` (top-left, bottom-left, bottom-right, top-right) of `dest_img`, in place.
+    Only the bounding rectangle of the quadrilateral is warped and blended.
+    """
+    h, w = dest_img.shape[:2]
     dest_points = np.array(dest_points, dtype=np.float32)
+    # 四邊形的外接矩形（限制在影像範圍內）
+    x0, y0 = np.maximum(np.floor(dest_points.min(axis=0)).astype(int), 0)
+    x1, y1 = np.minimum(np.ceil(dest_points.max(axis=0)).astype(int) + 1, [w, h])
+    if x1 <= x0 or y1 <= y0:
+        return dest_img
+    # 座標（相對於外接矩形）
+    src_h, src_w = src_img.shape[:2]
+    src_points = np.array([(0, 0), (0, src_h), (src_w, src_h), (src_w, 0)], dtype=np.float32)
+    local_points = dest_points - np.array([x0, y0], np.float32)
     # 計算轉換矩陣
-    transformation_matrix = cv2.getPerspectiveTransform(src_points, dest_points)
-    # 轉換圖片座標
-    src_img = cv2.resize(src_img, (w, h))
-    p_src_img = cv2.warpPerspective(src_img, transformation_matrix, (w, h))
+    transformation_matrix = cv2.getPerspectiveTransform(src_points, local_points)
+    roi = dest_img[y0:y1, x0:x1]
+    p_src_img = cv2.warpPerspective(src_img, transformation_matrix, (int(x1 - x0), int(y1 - y0)))
     # 建立遮罩
-    white_pad = np.full((h, w), 255, np.uint8)
-    fg_mask = cv2.warpPerspective(white_pad, transformation_matrix, (w, h))
-    bg_mask = cv2.bitwise_not(fg_mask)
-    # 合成
-    masked_fg_img = cv2.bitwise_or(p_src_img, p_src_img, mask=fg_mask)
-    masked_bg_img = cv2.bitwise_or(dest_img, dest_img, mask=bg_mask)
-    masked_img = cv2.bitwise_or(masked_fg_img, masked_bg_img)
-    output = cv2.addWeighted(masked_img, alpha, dest_img, 1 - alpha, 0)
+    fg_mask = np.zeros(roi.shape[:2], np.uint8)
+    cv2.fillConvexPoly(fg_mask, np.round(local_points).astype(np.int32), 255)
+    # 合成（直接寫回目標影像）
+    if alpha < 1:
+        p_src_img = cv2.addWeighted(p_src_img, alpha, roi, 1 - alpha, 0)
+    np.copyto(roi, p_src_img, where=fg_mask[:, :, None] > 0)
 
-    return output
+    return dest_img
 
 
-@functools.lru_cache(maxsize=999)
 def create_text_pad(text: str = 'Text', text_color=(0, 255, 255), bg_color=(255, 0, 0)) -> np.array:
     font = cv2.FONT_HERSHEY_SIMPLEX
     text_scale = 5
@@ -172,6 +521,28 @@ def create_text_pad(text: str = 'Text', text_color=(0, 255, 255), bg_color=(255,
     return text_pad
 
 
+class TextPadAtlas:
+    """
+    ID text pads (see create_text_pad) of every marker of a dictionary, stored as fixed-size cells of one array.
+    A pad is rendered the first time its ID is requested; embed_img stretches it onto the marker either way.
+    """
+
+    def __init__(self, marker_count: int, cell_size: Tuple[int, int] = (128, 64), text_color=(0, 255, 255), bg_color=(255, 0, 0)):
+        self.cell_size = cell_size
+        self.text_color = text_color
+        self.bg_color = bg_color
+        # np.zeros 不會立即佔用未寫入的記憶體分頁
+        self.pads = np.zeros((marker_count, cell_size[1], cell_size[0], 3), np.uint8)
+        self.rendered = np.zeros(marker_count, bool)
+
+    def __getitem__(self, marker_id: int) -> np.ndarray:
+        if not self.rendered[marker_id]:
+            text_pad = create_text_pad(str(marker_id), self.text_color, self.bg_color)
+            self.pads[marker_id] = cv2.resize(text_pad, self.cell_size, interpolation=cv2.INTER_AREA)
+            self.rendered[marker_id] = True
+        return self.pads[marker_id]
+
+
 def eat_events(window):
     """
     Simple, elegant fix
@@ -232,3 +603,17 @@ def load_coefficients(path='camera.yml'):
 
     cv_file.release()
     return [camera_matrix, distortion_coefficients]
+
+
+def load_coefficients_or_default(path='camera.yml', frame_size=(1280, 720)):
+    """ Loads camera matrix and distortion coefficients, using default values for missing ones. """
+    camera_matrix, distortion_coefficients = load_coefficients(path)
+    if camera_matrix is None:
+        print(f'No "camera_matrix" in {path}. Use default value.')
+        camera_matrix = np.array([[2000., 0., frame_size[0] / 2.],
+                                  [0., 2000., frame_size[1] / 2.],
+                                  [0., 0., 1.]])
+    if distortion_coefficients is None:
+        print(f'No "distortion_coefficients" in {path}. Use default value.')
+        distortion_coefficients = np.array([0., 0., 0., 0., 0.])
+    return [camera_matrix, distortion_coefficients]